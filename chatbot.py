@@ -1,11 +1,19 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 import numpy as np
 from datetime import datetime, timedelta
 import joblib
+import pickle
 import shared_state  
 import os  
 import json  
+import re
+import time
+from feature_kernels import (BUFFER_COLS, build_extractor_plan, emit_features, impute_columns,
+                             precompute_features, lookup_features, advance_replay, replay_lookup,
+                             POOL_SIZE, build_random_pool)
 
 # Config Streamlit Page
 st.set_page_config(
@@ -14,7 +22,10 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom Background (Same as Original)
+# Custom Background, Buttons & Sidebar (Same as Original)
+# All page CSS lives in one block so each rerun emits a single style element.
+# It still has to be emitted every run: Streamlit drops elements a rerun doesn't
+# re-create, so caching the st.markdown call would lose the styles.
 page_bg = """
 <style>
 [data-testid="stAppViewContainer"] {
@@ -24,15 +35,35 @@ page_bg = """
 [data-testid="stHeader"] {
     background: rgba(0,0,0,0);
 }
+/* Quick action buttons & chat input */
+div.stButton > button {
+    background-color: #FFD700;  
+    color: #4B2E05;             
+    border-radius: 8px;
+    padding: 0.35em 0.75em;
+    font-weight: bold;
+    transition: 0.3s;
+}
+div.stButton > button:hover {
+    background-color: #FFC200;  
+    color: #4B2E05;
+}
 input[type="text"] {
-    background-color: #041C32;   
-    color: #FDF5E6;             
-    border: 1px solid #0B3D91;   
+    background-color: #FFF8DC;  
+    color: #4B2E05;
+    border: 1px solid #BFC9CA;
     padding: 8px;
     border-radius: 8px;
 }
+/* Sidebar container */
+[data-testid="stSidebar"] {
+    background-color: #0E4D92; 
+}
+/* Sidebar text */
+[data-testid="stSidebar"] * {
+    color: white !important;
+}
 </style>
-
 """
 st.markdown(page_bg, unsafe_allow_html=True)
 
@@ -40,8 +71,15 @@ st.markdown(page_bg, unsafe_allow_html=True)
 @st.cache_resource
 def load_model():
     try:
-        model = joblib.load("final_tuned_model.pkl")
-        feature_columns = joblib.load("feature_columns.pkl")
+        # Pickle is stored uncompressed, so array buffers are memory-mapped read-only
+        model = joblib.load("final_tuned_model.pkl", mmap_mode='r')
+        # Plain list of names: stdlib pickle, no joblib array handling needed
+        with open("feature_columns.pkl", "rb") as f:
+            feature_columns = pickle.load(f)
+        # Single-row predictions: a thread pool per call costs more than it saves
+        model.n_jobs = 1
+        # Warm the prediction path now rather than on the first user-visible rerun
+        model.predict_proba(np.zeros((1, model.n_features_), dtype=np.float32))
         
         # Fix feature mismatch
         expected_features = model.n_features_
@@ -57,21 +95,61 @@ def load_model():
         return None, None
 
 model, feature_columns = load_model()
+shared_state.warm_up()  # connect to Google Sheets in the background while the page renders
 
 # Load CSV Data (Same as Dashboard)
+CSV_FILES = {
+    'normal': "normal_4h_before.csv",
+    'warning': "warning_4h_before.csv",
+    'failure': "failure_2h_before.csv",
+}
+FLOAT_COLS = ["pressure", "flow_rate", "temperature", "pump_speed", "compressor_state", "energy_consumption"]
+FLAG_COLS = ["valve_status", "pump_state", "alarm_triggered"]
+
+def parse_scenario_csv(csv_path):
+    """Parse a scenario CSV with Arrow's multithreaded reader, typed up front"""
+    column_types = {c: pa.float32() for c in FLOAT_COLS + FLAG_COLS}
+    column_types['timestamp'] = pa.timestamp('ns')
+    table = pa_csv.read_csv(csv_path, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+    return table.to_pandas()
+
+def read_scenario_csv(csv_path):
+    """Read a scenario CSV via a filled, downcast Parquet copy (same as dashboard)"""
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_parquet(parquet_path, engine='pyarrow')
+        except (OSError, ValueError):
+            pass  # unreadable (e.g. truncated) cache: treat it as a miss and rebuild it from the CSV
+    
+    df = parse_scenario_csv(csv_path)
+    # One (columns x rows) block, imputed column-parallel in a single scan per column
+    values = np.ascontiguousarray(df[FLOAT_COLS + FLAG_COLS].to_numpy(dtype=np.float32).T)
+    impute_columns(values)
+    df[FLOAT_COLS + FLAG_COLS] = values.T
+    df['timestamp'] = df['timestamp'].ffill().bfill()
+    df = df.astype({c: np.int8 for c in FLAG_COLS})
+    
+    # Cache for the next cold start; a read-only checkout just keeps using the CSV
+    # Written under a per-process temp name and swapped in, so a killed or concurrent write
+    # never leaves a partial file at parquet_path
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, parquet_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
+
 @st.cache_data
 def load_csv_data():
     """Load historical data from CSV files (same as dashboard)"""
     csv_data = {}
     
     try:
-        csv_data['normal'] = pd.read_csv("normal_4h_before.csv", parse_dates=['timestamp'])
-        csv_data['warning'] = pd.read_csv("warning_4h_before.csv", parse_dates=['timestamp'])
-        csv_data['failure'] = pd.read_csv("failure_2h_before.csv", parse_dates=['timestamp'])
-        
-        for scenario, df in csv_data.items():
-            df = df.fillna(method='ffill').fillna(method='bfill').fillna(0)
-            csv_data[scenario] = df
+        for scenario, csv_path in CSV_FILES.items():
+            csv_data[scenario] = read_scenario_csv(csv_path)
             
         return csv_data
     except FileNotFoundError:
@@ -80,8 +158,12 @@ def load_csv_data():
 csv_data = load_csv_data()
 
 # Data Generation (Same Logic as Dashboard)
+def track_replay(scenario, first_row, last_row):
+    """Update the replay state (see feature_kernels.advance_replay) for the CSV rows just served"""
+    st.session_state.replay = advance_replay(st.session_state.get('replay'), scenario, first_row, last_row)
+
 def create_scenario_data(scenario="normal"):
-    """Create data using same logic as dashboard"""
+    """Create data using same logic as dashboard, as a float32 vector in BUFFER_COLS order"""
     timestamp = datetime.now()
     
     if csv_data is None:
@@ -102,105 +184,76 @@ def create_scenario_data(scenario="normal"):
     
     current_row = scenario_data.iloc[row_index]
     st.session_state[f'{scenario}_row_index'] = row_index + 1
-    
-    return {
-        "timestamp": timestamp,
-        "pressure": float(current_row.get('pressure', 35.0)),
-        "flow_rate": float(current_row.get('flow_rate', 70.0)),
-        "temperature": float(current_row.get('temperature', 5.0)),
-        "valve_status": int(current_row.get('valve_status', 0)),
-        "pump_state": int(current_row.get('pump_state', 0)),
-        "pump_speed": float(current_row.get('pump_speed', 1000.0)),
-        "compressor_state": float(current_row.get('compressor_state', 0.5)),
-        "energy_consumption": float(current_row.get('energy_consumption', 25.0)),
-        "alarm_triggered": int(current_row.get('alarm_triggered', 0)),
-        "hour": timestamp.hour,
-        "dayofweek": timestamp.weekday()
-    }
+    track_replay(scenario, row_index, row_index)
+    
+    return np.array([
+        current_row.get('pressure', 35.0),
+        current_row.get('flow_rate', 70.0),
+        current_row.get('temperature', 5.0),
+        int(current_row.get('valve_status', 0)),
+        int(current_row.get('pump_state', 0)),
+        current_row.get('pump_speed', 1000.0),
+        current_row.get('compressor_state', 0.5),
+        current_row.get('energy_consumption', 25.0),
+        int(current_row.get('alarm_triggered', 0)),
+        timestamp.hour,
+        timestamp.weekday()
+    ], dtype=np.float32)
+
+@st.cache_resource
+def random_pool(scenario):
+    """Pre-drawn, pre-clipped fallback samples for one scenario (feature_kernels.build_random_pool)"""
+    return build_random_pool(scenario)
+
+def next_pool_index():
+    """Position in the fallback pools for this session"""
+    i = st.session_state.get('pool_idx', 0)
+    st.session_state.pool_idx = i + 1
+    return i % POOL_SIZE
 
 def create_fallback_data(scenario, timestamp):
     """Fallback data generation"""
-    if scenario == "normal":
-        pressure = np.random.normal(33.97, 9.05)
-        flow_rate = np.random.normal(72.07, 21.06)
-        temperature = np.random.normal(5.37, 1.86)
-        energy_consumption = np.random.normal(24.14, 10.58)
-        pump_speed = np.random.normal(999.74, 371.49)
-    elif scenario == "warning":
-        pressure = np.random.normal(34.86, 10.35)
-        flow_rate = np.random.normal(66.27, 18.86)
-        temperature = np.random.normal(4.96, 1.98)
-        energy_consumption = np.random.normal(24.77, 9.67)
-        pump_speed = np.random.normal(990.37, 403.25)
-    elif scenario == "failure":
-        pressure = np.random.normal(29.59, 6.19)
-        flow_rate = np.random.normal(57.78, 12.08)
-        temperature = np.random.normal(5.24, 1.53)
-        energy_consumption = np.random.normal(24.51, 5.85)
-        pump_speed = np.random.normal(1040.94, 302.46)
+    st.session_state.replay = None
+    pool = random_pool(scenario)
+    i = next_pool_index()
     
-    return {
-        "timestamp": timestamp,
-        "pressure": np.clip(pressure, 5, 80),
-        "flow_rate": np.clip(flow_rate, 5, 170),
-        "temperature": np.clip(temperature, 0, 15),
-        "valve_status": np.random.choice([0, 1]),
-        "pump_state": np.random.choice([0, 1]),
-        "pump_speed": np.clip(pump_speed, 0, 2000),
-        "compressor_state": np.random.uniform(0, 1),
-        "energy_consumption": np.clip(energy_consumption, 3, 70),
-        "alarm_triggered": 0 if scenario == "normal" else np.random.choice([0, 1]),
-        "hour": timestamp.hour,
-        "dayofweek": timestamp.weekday()
-    }
+    return np.array([pool[col][i] for col in BUFFER_COLS[:-2]] + [timestamp.hour, timestamp.weekday()],
+                    dtype=np.float32)
 
 # Feature Engineering (Same as Dashboard)
-def create_features(df):
-    """Apply EXACT same feature engineering as dashboard"""
-    if len(df) < 2:
-        return None
-        
-    df_fe = df.copy()
-    sensor_cols = ["pressure", "flow_rate", "temperature", "pump_speed", "energy_consumption"]
-    
-    # Lag features
-    LAGS = [1, 3, 6, 12, 30, 60, 120, 360]
-    for col in sensor_cols:
-        for lag in LAGS:
-            df_fe[f"{col}_lag{lag}"] = df_fe[col].shift(lag)
-    
-    # Rolling features
-    WINDOWS = [30, 60, 120, 360]
-    for col in sensor_cols:
-        for w in WINDOWS:
-            df_fe[f"{col}_rollmean{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).mean()
-            df_fe[f"{col}_rollstd{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).std()
-            df_fe[f"{col}_rollmin{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).min()
-            df_fe[f"{col}_rollmax{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).max()
-    
-    # Time features
-    df_fe["hour"] = df_fe["timestamp"].dt.hour
-    df_fe["dayofweek"] = df_fe["timestamp"].dt.dayofweek
+@st.cache_resource
+def load_feature_plan():
+    """Extractor plan for the loaded model, built once per process (no arguments to hash)"""
+    return build_extractor_plan(feature_columns, BUFFER_COLS, model.n_features_)
+
+def create_features(values, head=0, length=None):
+    """Apply EXACT same feature engineering as dashboard (last row only)
     
-    df_fe = df_fe.fillna(method='ffill').fillna(method='bfill').fillna(0)
+    values is a (len(BUFFER_COLS), capacity) ring buffer whose newest point sits
+    just before head; by default it is read as a plain chronological array.
+    """
+    if length is None:
+        length = values.shape[1]
+    if length < 2:
+        return None
     
     if model is None or feature_columns is None:
         return None
     
-    expected_features = model.n_features_
-    feature_values = []
-    
-    for col in feature_columns:
-        if col in df_fe.columns:
-            feature_values.append(df_fe[col].iloc[-1])
-        else:
-            feature_values.append(0.0)
+    op_ids, sensor_idxs, params = load_feature_plan()
     
-    while len(feature_values) < expected_features:
-        feature_values.append(0.0)
+    feature_values = np.zeros(model.n_features_, dtype=np.float32)
+    emit_features(values, head, length, op_ids, sensor_idxs, params, feature_values)
     
-    feature_values = feature_values[:expected_features]
-    return np.array(feature_values).reshape(1, -1)
+    return feature_values.reshape(1, -1)
+
+@st.cache_resource
+def load_feature_matrices():
+    """Precompute the feature matrix of every scenario CSV once (feature_kernels.precompute_features)"""
+    if csv_data is None or model is None or feature_columns is None:
+        return {}
+    plan = load_feature_plan()
+    return {scenario: precompute_features(df, plan) for scenario, df in csv_data.items()}
 
 def predict_with_model(features):
     """Make prediction using the model (same as dashboard)"""
@@ -223,8 +276,15 @@ def predict_with_model(features):
         return 0, [0.8, 0.1, 0.1]
 
 # Initialize Session State
-if 'data_buffer' not in st.session_state:
-    st.session_state.data_buffer = []
+BUFFER_SIZE = 500
+
+if 'sensor_buf' not in st.session_state:
+    # Ring buffer of the last BUFFER_SIZE points, one contiguous row per column
+    st.session_state.sensor_buf = np.zeros((len(BUFFER_COLS), BUFFER_SIZE), dtype=np.float32)
+    st.session_state.buf_head = 0
+    st.session_state.buf_len = 0
+    # Bumped on every buffer change; keys the cached inference below
+    st.session_state.buf_epoch = 0
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'current_scenario' not in st.session_state:
@@ -232,31 +292,80 @@ if 'current_scenario' not in st.session_state:
 if 'last_update' not in st.session_state:
     st.session_state.last_update = datetime.now()
 
+# Ring Buffer Helpers
+def buffer_append(values):
+    """Write one float32 data point (BUFFER_COLS order) into the ring buffer"""
+    head = st.session_state.buf_head
+    st.session_state.sensor_buf[:, head] = values
+    st.session_state.buf_head = (head + 1) % BUFFER_SIZE
+    st.session_state.buf_len = min(st.session_state.buf_len + 1, BUFFER_SIZE)
+    st.session_state.buf_epoch += 1
+
+def buffer_reset():
+    """Empty the ring buffer"""
+    st.session_state.buf_head = 0
+    st.session_state.buf_len = 0
+    st.session_state.buf_epoch += 1
+    st.session_state.replay = None
+
+def buffer_load(points):
+    """Replace the ring buffer contents with a list of data point dicts"""
+    points = points[-BUFFER_SIZE:]
+    n = len(points)
+    if n:
+        st.session_state.sensor_buf[:, :n] = np.array(
+            [[point.get(col, 0.0) for col in BUFFER_COLS] for point in points], dtype=np.float32
+        ).T
+    st.session_state.buf_head = n % BUFFER_SIZE
+    st.session_state.buf_len = n
+    st.session_state.buf_epoch += 1
+    st.session_state.replay = None
+
+def buffer_last():
+    """Latest data point as a column -> value dict"""
+    last = st.session_state.sensor_buf[:, (st.session_state.buf_head - 1) % BUFFER_SIZE]
+    return dict(zip(BUFFER_COLS, last.tolist()))
+
+# Shared State Lookup
+def get_shared_state_once():
+    """Dashboard state freshness check, done at most once per second per session"""
+    tick = int(time.time())
+    cached = st.session_state.get('shared_state_check')
+    if cached is None or cached[0] != tick:
+        # The dashboard syncs every SYNC_INTERVAL_SECONDS, and the read cache keeps serving a row until it is
+        # CACHE_MAX_AGE_SECONDS old (no autorefresh here, so an idle rerun can get one that old)
+        max_age = shared_state.SYNC_INTERVAL_SECONDS + shared_state.CACHE_MAX_AGE_SECONDS
+        is_fresh, state_data = shared_state.is_state_fresh(max_age_seconds=max_age)
+        cached = (tick, is_fresh, state_data)
+        st.session_state.shared_state_check = cached
+    return cached[1], cached[2]
+
 # ★ Get Current System Data (Synchronized with Dashboard) - UPDATED
 def get_current_system_data():
     """Get synchronized data from dashboard - FIXED VERSION"""
     
     try:
-        is_fresh, shared_state_data = shared_state.is_state_fresh(max_age_seconds=20)
+        is_fresh, shared_state_data = get_shared_state_once()
         
         if is_fresh and shared_state_data:
             st.sidebar.success("✅ Using dashboard data")
             
-            st.session_state.data_buffer = shared_state_data['data_buffer']
+            data_buffer = shared_state_data['data_buffer']
             st.session_state.current_scenario = shared_state_data['current_scenario']
             
             for scenario, index in shared_state_data['row_indices'].items():
                 st.session_state[f'{scenario}_row_index'] = index
             
-            if st.session_state.data_buffer:
-                df = pd.DataFrame(st.session_state.data_buffer)
-                current_data = df.iloc[-1]
+            buffer_load(data_buffer)
+            
+            if data_buffer:
+                current_data = data_buffer[-1]
                 
                 prediction_data = shared_state_data['prediction_data']
                 prediction = prediction_data['prediction']
                 probabilities = np.array(prediction_data['probabilities'])
                 
-                st.sidebar.info(f"📊 Synced: {len(st.session_state.data_buffer)} points")
+                st.sidebar.info(f"📊 Synced: {st.session_state.buf_len} points")
                 return current_data, prediction, probabilities
         else:
             st.sidebar.warning("⚠️ No fresh dashboard data")
@@ -269,69 +378,82 @@ def get_current_system_data():
     current_time = datetime.now()
     
     if (current_time - st.session_state.last_update).total_seconds() >= 10:
-        new_point = create_scenario_data(st.session_state.current_scenario)
-        st.session_state.data_buffer.append(new_point)
-        
-        if len(st.session_state.data_buffer) > 500:
-            st.session_state.data_buffer = st.session_state.data_buffer[-500:]
-        
+        buffer_append(create_scenario_data(st.session_state.current_scenario))
         st.session_state.last_update = current_time
     
-    if not st.session_state.data_buffer:
-        new_point = create_scenario_data(st.session_state.current_scenario)
-        st.session_state.data_buffer.append(new_point)
-    
-    df = pd.DataFrame(st.session_state.data_buffer)
-    current_data = df.iloc[-1]
-    
-    features = create_features(df)
+    if st.session_state.buf_len == 0:
+        buffer_append(create_scenario_data(st.session_state.current_scenario))
+    
+    # Reruns between data points (e.g. typing a question) reuse the last inference
+    cached = st.session_state.get('cached_infer')
+    if cached is not None and cached[0] == st.session_state.buf_epoch:
+        return cached[1:]
+    
+    current_data = buffer_last()
+    
+    # Precomputed CSV row only while it provably matches the buffer (feature_kernels.replay_lookup);
+    # anything else is engineered from the buffer (create_features returns None below 2 points)
+    length = st.session_state.buf_len
+    features = None
+    hit = replay_lookup(st.session_state.get('replay'), length, load_feature_plan()) if model is not None else None
+    if hit is not None and hit[0] in load_feature_matrices():
+        scenario, row = hit
+        features = lookup_features(load_feature_matrices()[scenario], load_feature_plan(), row,
+                                   current_data['hour'], current_data['dayofweek'])
+    if features is None:
+        features = create_features(st.session_state.sensor_buf, st.session_state.buf_head, length)
     prediction, probabilities = predict_with_model(features)
     
+    st.session_state.cached_infer = (st.session_state.buf_epoch, current_data, prediction, probabilities)
     return current_data, prediction, probabilities
 
 # Enhanced Chatbot Logic (Same Intelligence as Dashboard)
-def chatbot_response(query, current_data, prediction, probabilities):
-    """Enhanced chatbot with same intelligence as dashboard"""
-    query = query.lower()
-    
-    status_names = {0: "NORMAL", 1: "WARNING", 2: "FAILURE"}
-    status_colors = {0: "🟢", 1: "🟡", 2: "🔴"}
-    
-    if "pressure" in query:
-        pressure = current_data['pressure']
-        return f"<span style='font-size:18px; color:#5DADE2;'>📊 Current pressure is <b>{pressure:.1f} bar</b>. Status: {status_colors[prediction]} <b>{status_names[prediction]}</b></span>"
-    
-    elif "failure" in query:
-        confidence = np.max(probabilities)
-        health = (1 - probabilities[2]) * 100
-        return f"<span style='font-size:18px; color:#E74C3C;'>🔮 <b>AI Prediction:</b> {status_colors[prediction]} <b>{status_names[prediction]}</b> (Confidence: {confidence:.1%}, Health: {health:.0f}%)</span>"
-    
-    elif "energy" in query:
-        energy = current_data['energy_consumption']
-        return f"<span style='font-size:18px; color:#AF7AC5;'>🔋 Current energy consumption is <b>{energy:.1f} kWh</b>. System: {status_colors[prediction]} <b>{status_names[prediction]}</b></span>"
-    
-    elif "temperature" in query:
-        temp = current_data['temperature']
-        return f"<span style='font-size:18px; color:#F39C12;'>🌡️ Current temperature is <b>{temp:.1f} °C</b>. Status: {status_colors[prediction]} <b>{status_names[prediction]}</b></span>"
-    
-    elif "flow" in query:
-        flow = current_data['flow_rate']
-        return f"<span style='font-size:18px; color:#76D7C4;'>💧 Current flow rate is <b>{flow:.1f} m³/s</b>. System: {status_colors[prediction]} <b>{status_names[prediction]}</b></span>"
-    
-    elif any(word in query for word in ["status", "system", "overview"]):
-        confidence = np.max(probabilities)
-        health = (1 - probabilities[2]) * 100
-        return f"""<span style='font-size:18px; color:#58D68D;'>📋 <b>System Overview:</b><br>
-        • Status: {status_colors[prediction]} <b>{status_names[prediction]}</b><br>
+STATUS_NAMES = {0: "NORMAL", 1: "WARNING", 2: "FAILURE"}
+STATUS_COLORS = {0: "🟢", 1: "🟡", 2: "🔴"}
+
+# Reply templates, checked in this keyword priority order
+REPLY_KEYWORDS = [
+    ("pressure", "pressure"),
+    ("failure", "failure"),
+    ("energy", "energy"),
+    ("temperature", "temperature"),
+    ("flow", "flow"),
+    ("status", "overview"),
+    ("system", "overview"),
+    ("overview", "overview"),
+]
+# Lookahead so overlapping keywords ("systemperature") are all found in one scan
+KEYWORD_RE = re.compile(r"(?=(" + "|".join(word for word, _ in REPLY_KEYWORDS) + r"))")
+
+REPLY_TEMPLATES = {
+    "pressure": "<span style='font-size:18px; color:#5DADE2;'>📊 Current pressure is <b>{pressure:.1f} bar</b>. Status: {icon} <b>{status}</b></span>",
+    "failure": "<span style='font-size:18px; color:#E74C3C;'>🔮 <b>AI Prediction:</b> {icon} <b>{status}</b> (Confidence: {confidence:.1%}, Health: {health:.0f}%)</span>",
+    "energy": "<span style='font-size:18px; color:#AF7AC5;'>🔋 Current energy consumption is <b>{energy_consumption:.1f} kWh</b>. System: {icon} <b>{status}</b></span>",
+    "temperature": "<span style='font-size:18px; color:#F39C12;'>🌡️ Current temperature is <b>{temperature:.1f} °C</b>. Status: {icon} <b>{status}</b></span>",
+    "flow": "<span style='font-size:18px; color:#76D7C4;'>💧 Current flow rate is <b>{flow_rate:.1f} m³/s</b>. System: {icon} <b>{status}</b></span>",
+    "overview": """<span style='font-size:18px; color:#58D68D;'>📋 <b>System Overview:</b><br>
+        • Status: {icon} <b>{status}</b><br>
         • Confidence: <b>{confidence:.1%}</b><br>
         • Health: <b>{health:.0f}%</b><br>
-        • Pressure: <b>{current_data['pressure']:.1f} bar</b><br>
-        • Flow: <b>{current_data['flow_rate']:.1f} m³/s</b><br>
-        • Temperature: <b>{current_data['temperature']:.1f} °C</b><br>
-        • Energy: <b>{current_data['energy_consumption']:.1f} kWh</b></span>"""
+        • Pressure: <b>{pressure:.1f} bar</b><br>
+        • Flow: <b>{flow_rate:.1f} m³/s</b><br>
+        • Temperature: <b>{temperature:.1f} °C</b><br>
+        • Energy: <b>{energy_consumption:.1f} kWh</b></span>""",
+    None: "<span style='font-size:18px; color:#F1948A;'>❓ Sorry, I didn't understand. Try asking about pressure, failure, temperature, energy, flow, or system status. Current: {icon} <b>{status}</b></span>",
+}
+
+def chatbot_response(query, current_data, prediction, probabilities):
+    """Enhanced chatbot with same intelligence as dashboard"""
+    found = set(KEYWORD_RE.findall(query.lower()))
+    reply = next((reply for word, reply in REPLY_KEYWORDS if word in found), None)
     
-    else:
-        return f"<span style='font-size:18px; color:#F1948A;'>❓ Sorry, I didn't understand. Try asking about pressure, failure, temperature, energy, flow, or system status. Current: {status_colors[prediction]} <b>{status_names[prediction]}</b></span>"
+    return REPLY_TEMPLATES[reply].format(
+        icon=STATUS_COLORS[prediction],
+        status=STATUS_NAMES[prediction],
+        confidence=max(probabilities),
+        health=(1 - probabilities[2]) * 100,
+        **current_data
+    )
 
 # Title
 st.markdown(
@@ -347,30 +469,6 @@ if "chat_history" not in st.session_state:
 # Get Live Data (Synchronized with Dashboard)
 current_data, prediction, probabilities = get_current_system_data()
 
-st.markdown("""
-<style>
-div.stButton > button {
-    background-color: #FFD700;  
-    color: #4B2E05;             
-    border-radius: 8px;
-    padding: 0.35em 0.75em;
-    font-weight: bold;
-    transition: 0.3s;
-}
-div.stButton > button:hover {
-    background-color: #FFC200;  
-    color: #4B2E05;
-}
-input[type="text"] {
-    background-color: #FFF8DC;  
-    color: #4B2E05;
-    border: 1px solid #BFC9CA;
-    padding: 8px;
-    border-radius: 8px;
-}
-</style>
-""", unsafe_allow_html=True)
-
 # Quick Actions
 st.subheader("🚀 Quick Actions")
 col1, col2, col3, col4, col5 = st.columns(5)
@@ -412,21 +510,20 @@ if user_input:
 st.markdown("---")
 st.subheader("📜 Chat History")
 
-for role, msg in st.session_state.chat_history:
-    if role == "👤":
-        st.markdown(
-            f"<div style='background-color:#89CFF0; padding:12px; border-radius:15px; "
-            f"text-align:right; margin:8px; font-size:16px; color:#FDF5E6;'>"
-            f"<b>{role}:</b> {msg}</div>",
-            unsafe_allow_html=True
-        )
-    else:
-        st.markdown(
-            f"<div style='background-color:#1A3F66; padding:12px; border-radius:15px; "
-            f"text-align:left; margin:8px; font-size:16px; color:black;'>"
-            f"<b>{role}:</b> {msg}</div>",
-            unsafe_allow_html=True
-        )
+# One markdown element for the whole history instead of one per message
+USER_BUBBLE = ("<div style='background-color:#89CFF0; padding:12px; border-radius:15px; "
+               "text-align:right; margin:8px; font-size:16px; color:#FDF5E6;'>"
+               "<b>{role}:</b> {msg}</div>")
+BOT_BUBBLE = ("<div style='background-color:#1A3F66; padding:12px; border-radius:15px; "
+              "text-align:left; margin:8px; font-size:16px; color:black;'>"
+              "<b>{role}:</b> {msg}</div>")
+
+if st.session_state.chat_history:
+    st.markdown(
+        "".join((USER_BUBBLE if role == "👤" else BOT_BUBBLE).format(role=role, msg=msg)
+                for role, msg in st.session_state.chat_history),
+        unsafe_allow_html=True
+    )
 
 # Clear Chat (Same as Original)
 if st.button("🗑️ Clear Chat"):
@@ -439,7 +536,7 @@ with st.sidebar:
     st.write("### 🔄 Sync Status")
     
     try:
-        is_fresh, state_data = shared_state.is_state_fresh(max_age_seconds=20)
+        is_fresh, state_data = get_shared_state_once()
         if is_fresh and state_data:
             st.success("✅ Data is fresh")
             st.write(f"Points: {len(state_data.get('data_buffer', []))}")
@@ -452,27 +549,10 @@ with st.sidebar:
         st.error(f"❌ Error reading shared state: {e}")
     
     if st.button("🔄 Force Refresh"):
-        st.session_state.data_buffer = []
+        buffer_reset()
         st.rerun()
 
 # Scenario Selector (Hidden but functional)
 if 'scenario' in st.session_state:
     st.session_state.current_scenario = st.session_state.scenario
 
-# Custom Sidebar Style
-st.markdown(
-    """
-    <style>
-    /* Sidebar container */
-    [data-testid="stSidebar"] {
-        background-color: #0E4D92; 
-    }
-
-    /* Sidebar text */
-    [data-testid="stSidebar"] * {
-        color: white !important;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
@@ -0,0 +1,53 @@
+"""Re-export the model artifacts as uncompressed pickle protocol 5 files.
+
+Run once after retraining (python export_artifacts.py). load_model opens the
+model with joblib.load(..., mmap_mode='r'), which can only memory-map NumPy
+arrays that joblib wrote uncompressed. joblib writes arrays inline through its
+own NumpyArrayWrapper rather than as protocol 5 out-of-band buffers, so the
+protocol only sets the pickle format; the mapping comes from compress=0.
+feature_columns.pkl is a plain list of names and is written with stdlib pickle.
+Each file is written to a temporary path first and then swapped in, so a
+failed export leaves the original in place.
+"""
+import os
+import pickle
+
+import joblib
+
+MODEL_PATH = "final_tuned_model.pkl"
+FEATURE_COLUMNS_PATH = "feature_columns.pkl"
+
+def _replace(path, write):
+    """Call write(tmp_path), then move tmp_path over path; on failure path is untouched"""
+    tmp_path = path + ".tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def export_model(path=MODEL_PATH):
+    """Load the estimator and write it back uncompressed with protocol 5"""
+    model = joblib.load(path)
+    _replace(path, lambda tmp_path: joblib.dump(model, tmp_path, compress=0, protocol=5))
+    return model
+
+def export_feature_columns(path=FEATURE_COLUMNS_PATH):
+    """Rewrite the feature name list as a plain protocol 5 pickle"""
+    with open(path, "rb") as f:
+        feature_columns = pickle.load(f)
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            pickle.dump(feature_columns, f, protocol=5)
+
+    _replace(path, write)
+    return feature_columns
+
+if __name__ == "__main__":
+    export_model()
+    print(f"✅ Re-exported {MODEL_PATH} (protocol 5, uncompressed)")
+    export_feature_columns()
+    print(f"✅ Re-exported {FEATURE_COLUMNS_PATH} (protocol 5)")
@@ -0,0 +1,305 @@
+"""Feature engineering shared by the dashboard and the chatbot.
+
+Both apps import the buffer layout, the extractor plan, the CSV replay
+helpers, the fallback sample tables and the Numba kernels from here, so they
+always feed the model the same input layout and draw the same fallback
+distributions. Streamlit re-executes the app scripts on every rerun, so
+anything jitted there would be rebuilt each time; this module is imported once
+per process instead.
+Without Numba, emit_features falls back to NumPy reductions run per sensor on
+a small thread pool.
+"""
+import re
+
+import numpy as np
+from joblib import Parallel, delayed
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# Extractor op codes produced by build_extractor_plan
+OP_RAW, OP_LAG, OP_ROLLMEAN, OP_ROLLSTD, OP_ROLLMIN, OP_ROLLMAX, OP_ZERO = range(7)
+
+# Row order of the apps' (columns x capacity) ring buffers
+BUFFER_COLS = ["pressure", "flow_rate", "temperature", "valve_status", "pump_state", "pump_speed",
+               "compressor_state", "energy_consumption", "alarm_triggered", "hour", "dayofweek"]
+# Sensors that have lag/rolling features
+SENSOR_COLS = ["pressure", "flow_rate", "temperature", "pump_speed", "energy_consumption"]
+
+# Fallback data when a scenario CSV is missing: per-scenario normal distributions
+# over FALLBACK_SENSORS, clipped to physical ranges
+FALLBACK_SENSORS = ["pressure", "flow_rate", "temperature", "energy_consumption", "pump_speed"]
+FALLBACK_MEAN = {
+    "normal": np.array([33.97, 72.07, 5.37, 24.14, 999.74], dtype=np.float32),
+    "warning": np.array([34.86, 66.27, 4.96, 24.77, 990.37], dtype=np.float32),
+    "failure": np.array([29.59, 57.78, 5.24, 24.51, 1040.94], dtype=np.float32),
+}
+FALLBACK_STD = {
+    "normal": np.array([9.05, 21.06, 1.86, 10.58, 371.49], dtype=np.float32),
+    "warning": np.array([10.35, 18.86, 1.98, 9.67, 403.25], dtype=np.float32),
+    "failure": np.array([6.19, 12.08, 1.53, 5.85, 302.46], dtype=np.float32),
+}
+FALLBACK_LOW = np.array([5, 5, 0, 3, 0], dtype=np.float32)
+FALLBACK_HIGH = np.array([80, 170, 15, 70, 2000], dtype=np.float32)
+POOL_SIZE = 1024
+
+_LAG_RE = re.compile(rf"^({'|'.join(SENSOR_COLS)})_lag(\d+)$")
+_ROLL_RE = re.compile(rf"^({'|'.join(SENSOR_COLS)})_roll(mean|std|min|max)(\d+)$")
+_ROLL_OPS = {"mean": OP_ROLLMEAN, "std": OP_ROLLSTD, "min": OP_ROLLMIN, "max": OP_ROLLMAX}
+
+
+def build_extractor_plan(feature_columns, buffer_cols, n_features):
+    """Parse feature names once into (op_id, column index, lag/window) int64 arrays of length n_features.
+
+    Exactly one entry per model input: extra names are dropped, missing ones
+    and names that aren't buffer columns or sensor lags/rolls read as 0.
+    """
+    plan = []
+    for name in feature_columns[:n_features]:
+        m = _LAG_RE.match(name)
+        if m:
+            plan.append((OP_LAG, buffer_cols.index(m.group(1)), int(m.group(2))))
+            continue
+        m = _ROLL_RE.match(name)
+        if m:
+            plan.append((_ROLL_OPS[m.group(2)], buffer_cols.index(m.group(1)), int(m.group(3))))
+            continue
+        if name in buffer_cols:
+            plan.append((OP_RAW, buffer_cols.index(name), 0))
+        else:
+            plan.append((OP_ZERO, 0, 0))
+    plan += [(OP_ZERO, 0, 0)] * (n_features - len(plan))
+    return tuple(np.array(plan, dtype=np.int64).T.copy())
+
+
+def build_random_pool(scenario):
+    """POOL_SIZE pre-drawn, pre-clipped fallback samples for one scenario, as column -> array"""
+    rng = np.random.default_rng()
+    sensors = rng.normal(FALLBACK_MEAN[scenario], FALLBACK_STD[scenario], size=(POOL_SIZE, len(FALLBACK_SENSORS)))
+    np.clip(sensors, FALLBACK_LOW, FALLBACK_HIGH, out=sensors)
+    pool = dict(zip(FALLBACK_SENSORS, sensors.T.astype(np.float32)))
+    pool["valve_status"], pool["pump_state"], pool["alarm_triggered"] = rng.integers(0, 2, size=(3, POOL_SIZE), dtype=np.int8)
+    if scenario == "normal":
+        pool["alarm_triggered"][:] = 0
+    pool["compressor_state"] = rng.random(POOL_SIZE, dtype=np.float32)
+    return pool
+
+
+def precompute_features(df, plan):
+    """Features for every row of a scenario frame, as if the buffer held that scenario's rows up to it.
+
+    Returns an (rows x plan width) float32 matrix built with pandas shift/rolling,
+    one pass per feature. hour/dayofweek come from the wall clock and are filled
+    in by lookup_features.
+    """
+    op_ids, sensor_idxs, params = plan
+    values = df.reindex(columns=BUFFER_COLS).astype(np.float32)
+    matrix = np.zeros((len(df), len(op_ids)), dtype=np.float32)
+    for k in range(len(op_ids)):
+        op_id, column = op_ids[k], values.iloc[:, sensor_idxs[k]]
+        if op_id == OP_ZERO:
+            continue
+        if op_id == OP_RAW:
+            matrix[:, k] = column.fillna(0)
+        elif op_id == OP_LAG:
+            matrix[:, k] = column.shift(params[k]).fillna(0)
+        else:
+            rolled = column.shift(1).rolling(params[k], min_periods=1)
+            stats = {OP_ROLLMEAN: rolled.mean, OP_ROLLSTD: rolled.std, OP_ROLLMIN: rolled.min, OP_ROLLMAX: rolled.max}
+            matrix[:, k] = stats[op_id]().fillna(0)
+    return matrix
+
+
+def lookup_features(matrix, plan, row_index, hour, dayofweek):
+    """(1 x n) model input from one precomputed row plus the wall-clock fields the CSV doesn't carry"""
+    op_ids, sensor_idxs, _ = plan
+    features = matrix[row_index].copy()
+    raw = op_ids == OP_RAW
+    features[raw & (sensor_idxs == BUFFER_COLS.index("hour"))] = hour
+    features[raw & (sensor_idxs == BUFFER_COLS.index("dayofweek"))] = dayofweek
+    return features.reshape(1, -1)
+
+
+def advance_replay(replay, scenario, first_row, last_row):
+    """Replay state after appending CSV rows first_row..last_row (a wrap has last_row < first_row).
+
+    The state is (scenario, newest row, run length) of the contiguous replay
+    ending at the newest point. A scenario switch or a wrap to row 0 starts a
+    new run; callers reset it to None for fallback data and buffer resets.
+    """
+    if last_row < first_row:
+        run = last_row + 1
+    elif replay is not None and replay[0] == scenario and replay[1] + 1 == first_row:
+        run = replay[2] + last_row - first_row + 1
+    else:
+        run = last_row - first_row + 1
+    return (scenario, last_row, run)
+
+
+def replay_lookup(replay, length, plan):
+    """(scenario, row) whose precomputed features equal create_features on the buffer, or None.
+
+    That holds only while the buffer has at least two points, every one of its
+    length points belongs to the replay, and the buffer either starts at CSV
+    row 0 or is longer than the longest lag/window (so nothing outside it is read).
+    """
+    if replay is None or length < 2:
+        return None
+    scenario, row, run = replay
+    if run >= length and (row + 1 == length or length > plan[2].max()):
+        return scenario, row
+    return None
+
+
+def _tail_stats(buf, j, start, cap, lo, hi):
+    """(mean, std, min, max) of ring column j over logical positions lo..hi-1 in one pass.
+
+    std uses ddof=1 via Welford's running variance and is 0 for fewer than two
+    values. A single fixed window needs no monotonic deques: a running min/max
+    is already one comparison per value.
+    """
+    mean = 0.0
+    m2 = 0.0
+    lowest = buf[j, (start + lo) % cap]
+    highest = lowest
+    count = 0
+    for i in range(lo, hi):
+        x = buf[j, (start + i) % cap]
+        count += 1
+        delta = x - mean
+        mean += delta / count
+        m2 += delta * (x - mean)
+        lowest = min(lowest, x)
+        highest = max(highest, x)
+    std = np.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+    return mean, std, lowest, highest
+
+
+def _emit_features_loop(buf, head, length, op_ids, sensor_idxs, params, out):
+    """Write last-row features for a (columns x capacity) ring buffer into out.
+
+    The plan arrays hold one entry per element of out. The newest point sits
+    just before `head` and `length` points are valid.
+    Matches the pandas pipeline: lag k is 0 until more than k points exist, and
+    rolling stats cover the w points before the last one (std with ddof=1, 0
+    for fewer than two points). The four stats of a (column, window) pair are
+    computed together; the plan lists them next to each other.
+    """
+    cap = buf.shape[1]
+    start = (head - length) % cap
+    last = length - 1
+    stats_key_j = -1
+    stats_key_p = -1
+    mean = std = lowest = highest = 0.0
+
+    for k in range(op_ids.shape[0]):
+        op = op_ids[k]
+        j = sensor_idxs[k]
+        p = params[k]
+
+        if op == OP_RAW:
+            out[k] = buf[j, (start + last) % cap]
+        elif op == OP_LAG:
+            out[k] = buf[j, (start + last - p) % cap] if last >= p else 0.0
+        elif op == OP_ZERO:
+            out[k] = 0.0
+        else:
+            if j != stats_key_j or p != stats_key_p:
+                mean, std, lowest, highest = tail_stats(buf, j, start, cap, max(0, last - p), last)
+                stats_key_j = j
+                stats_key_p = p
+            if op == OP_ROLLMEAN:
+                out[k] = mean
+            elif op == OP_ROLLSTD:
+                out[k] = std
+            elif op == OP_ROLLMIN:
+                out[k] = lowest
+            else:
+                out[k] = highest
+
+
+def _reduce_column(column, op_ids, params):
+    """Last-row values of one chronological column for its slice of the plan"""
+    last = len(column) - 1
+    result = np.zeros(len(op_ids), dtype=np.float32)
+    for k in range(len(op_ids)):
+        op, p = op_ids[k], params[k]
+        if op == OP_RAW:
+            result[k] = column[last]
+        elif op == OP_LAG:
+            if last >= p:
+                result[k] = column[last - p]
+        elif op != OP_ZERO:
+            window = column[max(0, last - p):last]
+            if op == OP_ROLLMEAN:
+                result[k] = window.mean()
+            elif op == OP_ROLLSTD:
+                if len(window) > 1:
+                    result[k] = window.std(ddof=1)
+            elif op == OP_ROLLMIN:
+                result[k] = window.min()
+            else:
+                result[k] = window.max()
+    return result
+
+
+def _emit_features_threaded(buf, head, length, op_ids, sensor_idxs, params, out):
+    """emit_features without Numba: NumPy reductions, one thread-pool task per column"""
+    order = (head - length + np.arange(length)) % buf.shape[1]
+    values = buf[:, order]
+    columns = np.unique(sensor_idxs)
+    groups = [np.flatnonzero(sensor_idxs == j) for j in columns]
+    # NumPy reductions release the GIL, so threads are enough
+    results = Parallel(n_jobs=4, prefer="threads")(
+        delayed(_reduce_column)(values[j], op_ids[ks], params[ks]) for j, ks in zip(columns, groups)
+    )
+    for ks, result in zip(groups, results):
+        out[ks] = result
+
+
+def _impute_columns_loop(values):
+    """In-place ffill -> bfill -> 0 over each row of a (columns x rows) array, one scan per column"""
+    for j in prange(values.shape[0]):
+        column = values[j]
+        last_valid = np.nan
+        first_valid = -1
+        for i in range(column.shape[0]):
+            if np.isnan(column[i]):
+                column[i] = last_valid
+            else:
+                last_valid = column[i]
+                if first_valid < 0:
+                    first_valid = i
+        # Only a leading gap is still NaN: back-fill it, or zero an all-NaN column
+        fill = column[first_valid] if first_valid >= 0 else 0.0
+        for i in range(first_valid if first_valid >= 0 else column.shape[0]):
+            column[i] = fill
+
+
+def _impute_columns_numpy(values):
+    """impute_columns without Numba: a vectorized forward fill per column"""
+    for column in values:
+        mask = np.isnan(column)
+        if not mask.any():
+            continue
+        # Index of the last valid value at or before each position
+        idx = np.where(mask, 0, np.arange(len(column)))
+        np.maximum.accumulate(idx, out=idx)
+        column[:] = column[idx]
+        valid = ~np.isnan(column)
+        column[~valid] = column[valid.argmax()] if valid.any() else 0.0
+
+
+if HAVE_NUMBA:
+    tail_stats = njit(cache=True, fastmath=True)(_tail_stats)
+    emit_features = njit(cache=True, fastmath=True)(_emit_features_loop)
+    # Compile (or load from the on-disk cache) at import instead of on the first rerun
+    emit_features(np.zeros((1, 4), dtype=np.float32), 0, 4, np.array([OP_ROLLMEAN], dtype=np.int64),
+                  np.zeros(1, dtype=np.int64), np.array([2], dtype=np.int64), np.zeros(1, dtype=np.float32))
+    impute_columns = njit(cache=True, parallel=True)(_impute_columns_loop)
+else:
+    emit_features = _emit_features_threaded
+    impute_columns = _impute_columns_numpy
@@ -1,13 +1,21 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 import numpy as np
 from datetime import datetime, timedelta
-import time
 import joblib
+import pickle
 import plotly.graph_objects as go
+from streamlit_autorefresh import st_autorefresh
 import shared_state  
 import os  
 import json  
+from collections import deque, namedtuple
+from itertools import islice
+from feature_kernels import (BUFFER_COLS, build_extractor_plan, emit_features, impute_columns,
+                             precompute_features, lookup_features, advance_replay, replay_lookup,
+                             POOL_SIZE, build_random_pool)
 
 # ===============================
 # Config Streamlit Page
@@ -21,6 +29,8 @@ st.set_page_config(
 # ===============================
 # Custom Background + Styling
 # ===============================
+# One style block for the whole page (incl. sidebar buttons), emitted every run:
+# Streamlit drops elements a rerun doesn't re-create, so it can't be cached away.
 page_bg = """
 <style>
 [data-testid="stAppViewContainer"] {
@@ -46,18 +56,73 @@ h1, h2, h3, h4 {
 [data-testid="stMetricLabel"] {
     color: #D3D3D3;
 }
+[data-testid="stSidebar"] button, 
+[data-testid="stSidebar"] div.stButton > button {
+    background-color: #041C32;
+    color: #FDF5E6;
+    border: none;
+    border-radius: 5px;
+    padding: 0.35em 0.75em;
+    font-weight: bold;
+    transition: 0.3s;
+}
+[data-testid="stSidebar"] button:hover, 
+[data-testid="stSidebar"] div.stButton > button:hover {
+    background-color: #0B3D91;
+    color: #FDF5E6;
+}
+.chatbot-btn {
+    position: fixed;
+    bottom: 30px;
+    right: 30px;
+    width: 70px;
+    height: 70px;
+    background: linear-gradient(135deg, #1E90FF, #4CA1AF);
+    color: white;
+    border-radius: 50%;
+    text-align: center;
+    font-size: 32px;
+    font-weight: bold;
+    line-height: 70px;
+    box-shadow: 0 8px 20px rgba(0,0,0,0.35);
+    z-index: 9999;
+    cursor: pointer;
+    transition: all 0.4s cubic-bezier(.25,.8,.25,1);
+}
+.chatbot-btn:hover {
+    background: linear-gradient(135deg, #0B5ED7, #2C9AB7);
+    transform: scale(1.2) rotate(10deg);
+    box-shadow: 0 12px 25px rgba(0,0,0,0.45);
+}
+.chatbot-btn:active {
+    transform: scale(1) rotate(0deg);
+    box-shadow: 0 6px 15px rgba(0,0,0,0.3);
+}
 </style>
 """
 st.markdown(page_bg, unsafe_allow_html=True)
 
+# Both blocks are emitted on every rerun on purpose: Streamlit drops any element
+# a rerun doesn't re-emit, so a "sent once" session flag would remove the CSS
+# and the button after the first refresh. They are static strings instead.
+CHATBOT_URL = "https://digitopia-gas-project-5uqgx5ubnmmhjyrau7knyc.streamlit.app/"
+CHATBOT_BUTTON = '<a href="' + CHATBOT_URL + '" target="_blank" class="chatbot-btn">💬</a>'
+
 # ===============================
 # Load Model & Feature List
 # ===============================
 @st.cache_resource
 def load_model():
     try:
-        model = joblib.load("final_tuned_model.pkl")
-        feature_columns = joblib.load("feature_columns.pkl")
+        # Pickle is stored uncompressed, so array buffers are memory-mapped read-only
+        model = joblib.load("final_tuned_model.pkl", mmap_mode='r')
+        # Plain list of names: stdlib pickle, no joblib array handling needed
+        with open("feature_columns.pkl", "rb") as f:
+            feature_columns = pickle.load(f)
+        # Single-row predictions: a thread pool per call costs more than it saves
+        model.n_jobs = 1
+        # Warm the prediction path now rather than on the first user-visible rerun
+        model.predict_proba(np.zeros((1, model.n_features_), dtype=np.float32))
 
         expected_features = model.n_features_
         actual_features = len(feature_columns)
@@ -73,21 +138,58 @@ def load_model():
         st.stop()
 
 model, feature_columns = load_model()
+shared_state.warm_up()  # connect to Google Sheets in the background while the page renders
 
 # ===============================
 # Load CSV Data (Cached)
 # ===============================
+CSV_FILES = {
+    'normal': "normal_4h_before.csv",
+    'warning': "warning_4h_before.csv",
+    'failure': "failure_2h_before.csv",
+}
+FLOAT_COLS = ["pressure", "flow_rate", "temperature", "pump_speed", "compressor_state", "energy_consumption"]
+FLAG_COLS = ["valve_status", "pump_state", "alarm_triggered"]
+
+def parse_scenario_csv(csv_path):
+    # Arrow's multithreaded CSV reader, with column types fixed up front instead of inferred
+    column_types = {c: pa.float32() for c in FLOAT_COLS + FLAG_COLS}
+    column_types['timestamp'] = pa.timestamp('ns')
+    table = pa_csv.read_csv(csv_path, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+    return table.to_pandas()
+
+def read_scenario_csv(csv_path):
+    # Parse the CSV once, then reuse a filled, downcast Parquet copy next to it
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_parquet(parquet_path, engine='pyarrow')
+        except (OSError, ValueError):
+            pass  # unreadable (e.g. truncated) cache: treat it as a miss and rebuild it from the CSV
+    df = parse_scenario_csv(csv_path)
+    # One (columns x rows) block, imputed column-parallel in a single scan per column
+    values = np.ascontiguousarray(df[FLOAT_COLS + FLAG_COLS].to_numpy(dtype=np.float32).T)
+    impute_columns(values)
+    df[FLOAT_COLS + FLAG_COLS] = values.T
+    df['timestamp'] = df['timestamp'].ffill().bfill()
+    df = df.astype({c: np.int8 for c in FLAG_COLS})
+    # Written under a per-process temp name and swapped in, so a killed or concurrent write
+    # never leaves a partial file at parquet_path
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, parquet_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
+
 @st.cache_data
 def load_csv_data():
     csv_data = {}
     try:
-        csv_data['normal'] = pd.read_csv("normal_4h_before.csv", parse_dates=['timestamp'])
-        csv_data['warning'] = pd.read_csv("warning_4h_before.csv", parse_dates=['timestamp'])
-        csv_data['failure'] = pd.read_csv("failure_2h_before.csv", parse_dates=['timestamp'])
-
-        for scenario, df in csv_data.items():
-            df = df.fillna(method='ffill').fillna(method='bfill').fillna(0)
-            csv_data[scenario] = df
+        for scenario, csv_path in CSV_FILES.items():
+            csv_data[scenario] = read_scenario_csv(csv_path)
 
         st.sidebar.success(f"Loaded CSV data:")
         for scenario, df in csv_data.items():
@@ -103,6 +205,10 @@ csv_data = load_csv_data()
 # ===============================
 # Helper Functions
 # ===============================
+def track_replay(scenario, first_row, last_row):
+    # Replay state (see feature_kernels.advance_replay) for the CSV rows just served
+    st.session_state.replay = advance_replay(st.session_state.get('replay'), scenario, first_row, last_row)
+
 def create_scenario_data(scenario="normal", n_points=1):
     timestamp = datetime.now()
     if csv_data is None:
@@ -118,6 +224,7 @@ def create_scenario_data(scenario="normal", n_points=1):
         st.session_state[f'{scenario}_row_index'] = 0
     current_row = scenario_data.iloc[row_index]
     st.session_state[f'{scenario}_row_index'] = row_index + 1
+    track_replay(scenario, row_index, row_index)
     return {
         "timestamp": timestamp,
         "pressure": float(current_row.get('pressure', 35.0)),
@@ -133,97 +240,239 @@ def create_scenario_data(scenario="normal", n_points=1):
         "dayofweek": timestamp.weekday()
     }
 
+@st.cache_resource
+def random_pool(scenario):
+    # Draw the shared fallback tables once per process; create_fallback_data only indexes the pool
+    return build_random_pool(scenario)
+
+def next_pool_index():
+    # Per-session read position into the shared pools
+    i = st.session_state.get('pool_idx', 0)
+    st.session_state.pool_idx = i + 1
+    return i % POOL_SIZE
+
 def create_fallback_data(scenario, timestamp):
-    if scenario == "normal":
-        pressure = np.random.normal(33.97, 9.05)
-        flow_rate = np.random.normal(72.07, 21.06)
-        temperature = np.random.normal(5.37, 1.86)
-        energy_consumption = np.random.normal(24.14, 10.58)
-        pump_speed = np.random.normal(999.74, 371.49)
-    elif scenario == "warning":
-        pressure = np.random.normal(34.86, 10.35)
-        flow_rate = np.random.normal(66.27, 18.86)
-        temperature = np.random.normal(4.96, 1.98)
-        energy_consumption = np.random.normal(24.77, 9.67)
-        pump_speed = np.random.normal(990.37, 403.25)
-    elif scenario == "failure":
-        pressure = np.random.normal(29.59, 6.19)
-        flow_rate = np.random.normal(57.78, 12.08)
-        temperature = np.random.normal(5.24, 1.53)
-        energy_consumption = np.random.normal(24.51, 5.85)
-        pump_speed = np.random.normal(1040.94, 302.46)
+    st.session_state.replay = None
+    pool = random_pool(scenario)
+    i = next_pool_index()
     return {
         "timestamp": timestamp,
-        "pressure": np.clip(pressure, 5, 80),
-        "flow_rate": np.clip(flow_rate, 5, 170),
-        "temperature": np.clip(temperature, 0, 15),
-        "valve_status": np.random.choice([0, 1]),
-        "pump_state": np.random.choice([0, 1]),
-        "pump_speed": np.clip(pump_speed, 0, 2000),
-        "compressor_state": np.random.uniform(0, 1),
-        "energy_consumption": np.clip(energy_consumption, 3, 70),
-        "alarm_triggered": 0 if scenario == "normal" else np.random.choice([0, 1]),
+        "pressure": float(pool["pressure"][i]),
+        "flow_rate": float(pool["flow_rate"][i]),
+        "temperature": float(pool["temperature"][i]),
+        "valve_status": int(pool["valve_status"][i]),
+        "pump_state": int(pool["pump_state"][i]),
+        "pump_speed": float(pool["pump_speed"][i]),
+        "compressor_state": float(pool["compressor_state"][i]),
+        "energy_consumption": float(pool["energy_consumption"][i]),
+        "alarm_triggered": int(pool["alarm_triggered"][i]),
         "hour": timestamp.hour,
         "dayofweek": timestamp.weekday()
     }
 
-def create_features(df):
-    if len(df) < 2:
+@st.cache_resource
+def load_feature_plan():
+    # Built once per process; no arguments, so reruns don't hash feature_columns for the cache key
+    return build_extractor_plan(feature_columns, BUFFER_COLS, model.n_features_)
+
+def create_features(values, head=0, length=None):
+    # Only the last row is fed to the model, so compute just that row's lag/rolling
+    # values in a compiled kernel instead of building full shifted/rolled columns.
+    # values is (columns x capacity); with the defaults it is read in column order.
+    if length is None:
+        length = values.shape[1]
+    if length < 2:
         return None
-    df_fe = df.copy()
-    sensor_cols = ["pressure", "flow_rate", "temperature", "pump_speed", "energy_consumption"]
-    LAGS = [1, 3, 6, 12, 30, 60, 120, 360]
-    for col in sensor_cols:
-        for lag in LAGS:
-            df_fe[f"{col}_lag{lag}"] = df_fe[col].shift(lag)
-    WINDOWS = [30, 60, 120, 360]
-    for col in sensor_cols:
-        for w in WINDOWS:
-            df_fe[f"{col}_rollmean{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).mean()
-            df_fe[f"{col}_rollstd{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).std()
-            df_fe[f"{col}_rollmin{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).min()
-            df_fe[f"{col}_rollmax{w}"] = df_fe[col].shift(1).rolling(window=w, min_periods=1).max()
-    df_fe["hour"] = df_fe["timestamp"].dt.hour
-    df_fe["dayofweek"] = df_fe["timestamp"].dt.dayofweek
-    df_fe = df_fe.fillna(method='ffill').fillna(method='bfill').fillna(0)
-    expected_features = model.n_features_
-    feature_values = []
-    for col in feature_columns:
-        if col in df_fe.columns:
-            feature_values.append(df_fe[col].iloc[-1])
-        else:
-            feature_values.append(0.0)
-    while len(feature_values) < expected_features:
-        feature_values.append(0.0)
-    feature_values = feature_values[:expected_features]
-    return np.array(feature_values).reshape(1, -1)
+    op_ids, sensor_idxs, params = load_feature_plan()
+    feature_values = np.zeros(model.n_features_, dtype=np.float32)
+    emit_features(values, head, length, op_ids, sensor_idxs, params, feature_values)
+    return feature_values.reshape(1, -1)
+
+@st.cache_resource
+def load_feature_matrices():
+    # Precomputed CSV replay features per scenario (feature_kernels.precompute_features)
+    if csv_data is None:
+        return {}
+    plan = load_feature_plan()
+    return {scenario: precompute_features(df, plan) for scenario, df in csv_data.items()}
+
+def create_scenario_batch(scenario, n):
+    # n consecutive points in one gather (wrapping to row 0 like create_scenario_data),
+    # 10 s apart and ending now; returns (columns x n) float32 values and their timestamps
+    timestamps = pd.date_range(end=datetime.now(), periods=n, freq="10s")
+    values = np.empty((len(BUFFER_COLS), n), dtype=np.float32)
+    values[-2] = timestamps.hour
+    values[-1] = timestamps.dayofweek
+    scenario_data = csv_data.get(scenario) if csv_data is not None else None
+    if scenario_data is None or len(scenario_data) == 0:
+        pool = random_pool(scenario)
+        start = st.session_state.get('pool_idx', 0)
+        st.session_state.pool_idx = start + n
+        idx = (start + np.arange(n)) % POOL_SIZE
+        values[:-2] = [pool[col][idx] for col in BUFFER_COLS[:-2]]
+        st.session_state.replay = None
+        return values, timestamps.to_numpy()
+    start = st.session_state.get(f'{scenario}_row_index', 0)
+    rows = (start + np.arange(n)) % len(scenario_data)
+    values[:-2] = scenario_data[BUFFER_COLS[:-2]].iloc[rows].to_numpy(dtype=np.float32).T
+    st.session_state[f'{scenario}_row_index'] = int(rows[-1]) + 1
+    track_replay(scenario, int(rows[0]), int(rows[-1]))
+    return values, timestamps.to_numpy()
+
+def current_features():
+    length = st.session_state.buf_len
+    if length < 2:
+        return None
+    # Precomputed CSV row only while it provably matches the buffer (feature_kernels.replay_lookup)
+    hit = replay_lookup(st.session_state.get('replay'), length, load_feature_plan())
+    if hit is not None:
+        scenario, row = hit
+        last_point = buffer_last()
+        return lookup_features(load_feature_matrices()[scenario], load_feature_plan(), row,
+                               last_point['hour'], last_point['dayofweek'])
+    # Anything else (fallback data, scenario switch, wrap, reset): engineer features from the ring buffer
+    return create_features(st.session_state.sensor_buf, st.session_state.buf_head, length)
+
+# Probabilities stay a float32 array; the scalars the UI reads are pulled out once
+PredictionResult = namedtuple('PredictionResult', ['prediction', 'probs', 'conf', 'p_warn', 'p_fail'])
+DEFAULT_PREDICTION = PredictionResult(0, np.array([0.8, 0.1, 0.1], dtype=np.float32), 0.8, 0.1, 0.1)
 
 def predict_with_model(features):
     try:
         if features is None:
-            return 0, [0.8, 0.1, 0.1]
-        probabilities = model.predict_proba(features)[0]
-        if probabilities[2] > 0.4:
+            return DEFAULT_PREDICTION
+        probabilities = model.predict_proba(features)[0].astype(np.float32, copy=False)
+        p_warn, p_fail = float(probabilities[1]), float(probabilities[2])
+        if p_fail > 0.4:
             prediction = 2
-        elif probabilities[1] > 0.4:
+        elif p_warn > 0.4:
             prediction = 1
         else:
             prediction = 0
-        return prediction, probabilities
+        return PredictionResult(prediction, probabilities, float(probabilities.max()), p_warn, p_fail)
     except Exception as e:
         st.error(f"Prediction error: {str(e)}")
-        return 0, [0.8, 0.1, 0.1]
+        return DEFAULT_PREDICTION
+
+def current_prediction():
+    # The prediction only changes when a point is added; plain reruns reuse it
+    cached = st.session_state.get('pred_cache')
+    if cached is not None and cached[0] == st.session_state.buf_epoch:
+        return cached[1]
+    result = predict_with_model(current_features())
+    st.session_state.pred_cache = (st.session_state.buf_epoch, result)
+    return result
 
 # ===============================
 # Initialize Session State
 # ===============================
-if 'data_buffer' not in st.session_state:
-    st.session_state.data_buffer = []
+BUFFER_SIZE = 500
+
+if 'sensor_buf' not in st.session_state:
+    # Ring buffer of the last BUFFER_SIZE points: one contiguous float32 row per column,
+    # timestamps alongside; DataFrames/records are only built for the tail that is shown or synced
+    st.session_state.sensor_buf = np.zeros((len(BUFFER_COLS), BUFFER_SIZE), dtype=np.float32)
+    st.session_state.timestamps = np.zeros(BUFFER_SIZE, dtype='datetime64[us]')
+    st.session_state.buf_head = 0
+    st.session_state.buf_len = 0
+    st.session_state.buf_epoch = 0
 if 'prediction_history' not in st.session_state:
-    st.session_state.prediction_history = []
+    # Bounded: appending the 21st entry drops the oldest, no slice copy
+    st.session_state.prediction_history = deque(maxlen=20)
 if 'last_update' not in st.session_state:
     st.session_state.last_update = datetime.now()
 
+# ===============================
+# Ring Buffer Helpers
+# ===============================
+INT_COLS = {"valve_status", "pump_state", "alarm_triggered", "hour", "dayofweek"}
+
+def buffer_append(point):
+    head = st.session_state.buf_head
+    st.session_state.sensor_buf[:, head] = [point[col] for col in BUFFER_COLS]
+    st.session_state.timestamps[head] = point['timestamp']
+    st.session_state.buf_head = (head + 1) % BUFFER_SIZE
+    st.session_state.buf_len = min(st.session_state.buf_len + 1, BUFFER_SIZE)
+    st.session_state.buf_epoch += 1
+
+def buffer_extend(values, timestamps):
+    # Append a (columns x n) block in one scatter; only the newest BUFFER_SIZE points are kept
+    values, timestamps = values[:, -BUFFER_SIZE:], timestamps[-BUFFER_SIZE:]
+    n = values.shape[1]
+    positions = (st.session_state.buf_head + np.arange(n)) % BUFFER_SIZE
+    st.session_state.sensor_buf[:, positions] = values
+    st.session_state.timestamps[positions] = timestamps
+    st.session_state.buf_head = (st.session_state.buf_head + n) % BUFFER_SIZE
+    st.session_state.buf_len = min(st.session_state.buf_len + n, BUFFER_SIZE)
+    st.session_state.buf_epoch += 1
+
+def buffer_reset():
+    st.session_state.buf_head = 0
+    st.session_state.buf_len = 0
+    st.session_state.buf_epoch += 1
+    st.session_state.replay = None
+
+def buffer_positions(n):
+    # Ring slots of the newest n points, oldest first
+    n = min(n, st.session_state.buf_len)
+    return (st.session_state.buf_head - n + np.arange(n)) % BUFFER_SIZE
+
+def buffer_records(n):
+    # Newest n points as plain-Python dicts (the shape the shared state sync expects)
+    idx = buffer_positions(n)
+    columns = st.session_state.sensor_buf[:, idx].tolist()
+    records = [{'timestamp': ts} for ts in st.session_state.timestamps[idx].astype(object)]
+    for col, values in zip(BUFFER_COLS, columns):
+        cast = int if col in INT_COLS else float
+        for record, value in zip(records, values):
+            record[col] = cast(value)
+    return records
+
+def buffer_last():
+    return buffer_records(1)[0]
+
+def buffer_tail(n):
+    # Newest n points straight off the ring: (timestamps, columns x n values), no DataFrame
+    head = st.session_state.buf_head
+    start = head - min(n, st.session_state.buf_len)
+    if start >= 0:
+        # Not wrapped: plain slices, i.e. views
+        return st.session_state.timestamps[start:head], st.session_state.sensor_buf[:, start:head]
+    idx = buffer_positions(n)
+    return st.session_state.timestamps[idx], st.session_state.sensor_buf[:, idx]
+
+# ===============================
+# Chart Helpers
+# ===============================
+CHART_SPECS = [
+    ('pressure', 'Pressure', '#5DADE2', "Pressure (bar)"),
+    ('flow_rate', 'Flow Rate', '#76D7C4', "Flow Rate"),
+    ('temperature', 'Temperature', '#F39C12', "Temperature (°C)"),
+    ('energy_consumption', 'Energy', '#AF7AC5', "Energy Consumption"),
+]
+
+def chart_figure(column, name, color, title, timestamps, values):
+    # Each session builds the styled figure once; reruns only swap the trace data
+    figures = st.session_state.setdefault('chart_figures', {})
+    fig = figures.get(column)
+    if fig is None:
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            mode='lines+markers',
+            name=name,
+            line=dict(color=color, width=3)
+        ))
+        fig.update_layout(
+            title=f"<b style='color:gold;'>{title}</b>",
+            height=300,
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            font=dict(color="white")
+        )
+        figures[column] = fig
+    fig.update_traces(x=timestamps, y=values[BUFFER_COLS.index(column)], selector=0)
+    return fig
+
 # ===============================
 # Sidebar
 # ===============================
@@ -233,39 +482,17 @@ with st.sidebar:
     st.info(f"Auto-updating every 10 seconds")
     st.write(f"Last update: {st.session_state.last_update.strftime('%H:%M:%S')}")
 
-    st.markdown("""
-<style>
-[data-testid="stSidebar"] button, 
-[data-testid="stSidebar"] div.stButton > button {
-    background-color: #041C32;
-    color: #FDF5E6;
-    border: none;
-    border-radius: 5px;
-    padding: 0.35em 0.75em;
-    font-weight: bold;
-    transition: 0.3s;
-}
-[data-testid="stSidebar"] button:hover, 
-[data-testid="stSidebar"] div.stButton > button:hover {
-    background-color: #0B3D91;
-    color: #FDF5E6;
-}
-</style>
-""", unsafe_allow_html=True)
-
     if st.button("Reset Data"):
-        st.session_state.data_buffer = []
-        st.session_state.prediction_history = []
+        buffer_reset()
+        st.session_state.prediction_history.clear()
         for s in ['normal', 'warning', 'failure']:
             if f'{s}_row_index' in st.session_state:
                 st.session_state[f'{s}_row_index'] = 0
         st.rerun()
 
     if st.button("🚀 Fast Simulation (Load 50 historical points)"):
-        for i in range(50):
-            new_point = create_scenario_data(scenario)
-            st.session_state.data_buffer.append(new_point)
-        st.success(f"Loaded 50 historical data points! Total: {len(st.session_state.data_buffer)}")
+        buffer_extend(*create_scenario_batch(scenario, 50))
+        st.success(f"Loaded 50 historical data points! Total: {st.session_state.buf_len}")
         st.rerun()
 
     if csv_data:
@@ -279,9 +506,9 @@ with st.sidebar:
     else:
         st.warning("⚠️ Using fallback random data")
 
-    st.write(f"Data points: {len(st.session_state.data_buffer)}")
-    if st.session_state.data_buffer:
-        last_data = st.session_state.data_buffer[-1]
+    st.write(f"Data points: {st.session_state.buf_len}")
+    if st.session_state.buf_len:
+        last_data = buffer_last()
         st.write(f"Current values:")
         st.write(f"- Pressure: {last_data['pressure']:.1f}")
         st.write(f"- Flow: {last_data['flow_rate']:.1f}")
@@ -300,7 +527,7 @@ with st.sidebar:
     except Exception as e:
         st.error(f"❌ Could not check Google Sheets: {e}")
 
-    st.write(f"Buffer size: {len(st.session_state.data_buffer)}")
+    st.write(f"Buffer size: {st.session_state.buf_len}")
     st.write(f"Current scenario: {scenario}")
 
 # ===============================
@@ -318,13 +545,14 @@ with st.expander("ℹ️ About the Data", expanded=False):
     - **Failure**: Data from 4 hours before critical system failures
     """)
 
-current_time = datetime.now()
-if (current_time - st.session_state.last_update).total_seconds() >= 10:
-    new_point = create_scenario_data(scenario)
-    st.session_state.data_buffer.append(new_point)
+# Rerun at the data cadence; widget interactions rerun on their own
+REFRESH_SECONDS = 10
+st_autorefresh(interval=REFRESH_SECONDS * 1000, key="datarefresh")
 
-    if len(st.session_state.data_buffer) > 500:
-        st.session_state.data_buffer = st.session_state.data_buffer[-500:]
+current_time = datetime.now()
+# Half a second of slack so browser timer jitter doesn't skip a whole tick
+if (current_time - st.session_state.last_update).total_seconds() >= REFRESH_SECONDS - 0.5:
+    buffer_append(create_scenario_data(scenario))
 
     st.session_state.last_update = current_time
 
@@ -332,19 +560,17 @@ if (current_time - st.session_state.last_update).total_seconds() >= 10:
     for s in ['normal', 'warning', 'failure']:
         row_indices[s] = st.session_state.get(f'{s}_row_index', 0)
 
-    df = pd.DataFrame(st.session_state.data_buffer)
-    features = create_features(df)
-    prediction, probabilities = predict_with_model(features)
+    result = current_prediction()
 
     prediction_data = {
-        'prediction': int(prediction),
-        'probabilities': np.array(probabilities).tolist(),
-        'confidence': float(np.max(probabilities))
+        'prediction': result.prediction,
+        'probabilities': result.probs,
+        'confidence': result.conf
     }
 
     try:
         save_success = shared_state.save_shared_state(
-            st.session_state.data_buffer[-50:],  
+            buffer_records(20),  # the shared state only keeps the newest 20 points
             scenario,
             row_indices,
             prediction_data
@@ -354,21 +580,16 @@ if (current_time - st.session_state.last_update).total_seconds() >= 10:
 
     st.rerun()
 
-if st.session_state.data_buffer:
-    df = pd.DataFrame(st.session_state.data_buffer)
-    features = create_features(df)
-    prediction, probabilities = predict_with_model(features)
+if st.session_state.buf_len:
+    prediction, probabilities, confidence, p_warn, p_fail = current_prediction()
 
     st.session_state.prediction_history.append({
-        'timestamp': df.iloc[-1]['timestamp'],
+        'timestamp': buffer_last()['timestamp'],
         'prediction': prediction,
-        'confidence': np.max(probabilities),
+        'confidence': confidence,
         'probabilities': probabilities
     })
 
-    if len(st.session_state.prediction_history) > 20:
-        st.session_state.prediction_history = st.session_state.prediction_history[-20:]
-
     col1, col2, col3, col4 = st.columns(4)
     status_colors = {0: "🟢", 1: "🟡", 2: "🔴"}
     status_names = {0: "NORMAL", 1: "WARNING", 2: "FAILURE"}
@@ -376,101 +597,33 @@ if st.session_state.data_buffer:
     with col1:
         st.metric("System Status (2h Prediction)", f"{status_colors[prediction]} {status_names[prediction]}")
     with col2:
-        st.metric("Confidence", f"{np.max(probabilities):.1%}")
+        st.metric("Confidence", f"{confidence:.1%}")
     with col3:
         alerts = len([p for p in st.session_state.prediction_history if p['prediction'] > 0])
         st.metric("Recent Alerts", str(alerts))
     with col4:
-        health = (1 - probabilities[2]) * 100
+        health = (1 - p_fail) * 100
         st.metric("System Health", f"{health:.0f}%")
 
     st.sidebar.write("### Debug Info")
     st.sidebar.write(f"Prediction: {prediction} ({status_names[prediction]})")
     st.sidebar.write(f"Probabilities:")
     st.sidebar.write(f"- Normal: {probabilities[0]:.3f}")
-    st.sidebar.write(f"- Warning: {probabilities[1]:.3f}")
-    st.sidebar.write(f"- Failure: {probabilities[2]:.3f}")
+    st.sidebar.write(f"- Warning: {p_warn:.3f}")
+    st.sidebar.write(f"- Failure: {p_fail:.3f}")
 
     st.subheader("Real-Time Monitoring")
-    recent_data = df.tail(50) if len(df) > 50 else df
-
-    chart_col1, chart_col2 = st.columns(2)
-    with chart_col1:
-        fig1 = go.Figure()
-        fig1.add_trace(go.Scatter(
-            x=recent_data['timestamp'],
-            y=recent_data['pressure'],
-            mode='lines+markers',
-            name='Pressure',
-            line=dict(color='#5DADE2', width=3)
-        ))
-        fig1.update_layout(
-            title="<b style='color:gold;'>Pressure (bar)</b>",
-            height=300,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="white")
-        )
-        st.plotly_chart(fig1, use_container_width=True)
+    timestamps, values = buffer_tail(50)
 
-    with chart_col2:
-        fig2 = go.Figure()
-        fig2.add_trace(go.Scatter(
-            x=recent_data['timestamp'],
-            y=recent_data['flow_rate'],
-            mode='lines+markers',
-            name='Flow Rate',
-            line=dict(color='#76D7C4', width=3)
-        ))
-        fig2.update_layout(
-            title="<b style='color:gold;'>Flow Rate</b>",
-            height=300,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="white")
-        )
-        st.plotly_chart(fig2, use_container_width=True)
-
-    chart_col3, chart_col4 = st.columns(2)
-    with chart_col3:
-        fig3 = go.Figure()
-        fig3.add_trace(go.Scatter(
-            x=recent_data['timestamp'],
-            y=recent_data['temperature'],
-            mode='lines+markers',
-            name='Temperature',
-            line=dict(color='#F39C12', width=3)
-        ))
-        fig3.update_layout(
-            title="<b style='color:gold;'>Temperature (°C)</b>",
-            height=300,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="white")
-        )
-        st.plotly_chart(fig3, use_container_width=True)
-
-    with chart_col4:
-        fig4 = go.Figure()
-        fig4.add_trace(go.Scatter(
-            x=recent_data['timestamp'],
-            y=recent_data['energy_consumption'],
-            mode='lines+markers',
-            name='Energy',
-            line=dict(color='#AF7AC5', width=3)
-        ))
-        fig4.update_layout(
-            title="<b style='color:gold;'>Energy Consumption</b>",
-            height=300,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color="white")
-        )
-        st.plotly_chart(fig4, use_container_width=True)
+    chart_cols = st.columns(2) + st.columns(2)
+    for chart_col, (column, name, color, title) in zip(chart_cols, CHART_SPECS):
+        with chart_col:
+            st.plotly_chart(chart_figure(column, name, color, title, timestamps, values), use_container_width=True)
 
     st.subheader("Recent Predictions")
     if st.session_state.prediction_history:
-        pred_df = pd.DataFrame(st.session_state.prediction_history[-10:])
+        history = st.session_state.prediction_history
+        pred_df = pd.DataFrame(list(islice(history, max(0, len(history) - 10), None)))
         status_names = {0: "NORMAL", 1: "WARNING", 2: "FAILURE"}
         pred_df['status'] = pred_df['prediction'].map(status_names)
         pred_df['time'] = pred_df['timestamp'].dt.strftime('%H:%M:%S')
@@ -493,46 +646,5 @@ if st.session_state.data_buffer:
 else:
     st.info("Waiting for data... Dashboard will start automatically.")
 
-# Floating Chatbot Button (Round Style)
-chatbot_url = "https://digitopia-gas-project-5uqgx5ubnmmhjyrau7knyc.streamlit.app/"
-
-st.markdown(
-    f"""
-    <style>
-    .chatbot-btn {{
-        position: fixed;
-        bottom: 30px;
-        right: 30px;
-        width: 70px;
-        height: 70px;
-        background: linear-gradient(135deg, #1E90FF, #4CA1AF);
-        color: white;
-        border-radius: 50%;
-        text-align: center;
-        font-size: 32px;
-        font-weight: bold;
-        line-height: 70px;
-        box-shadow: 0 8px 20px rgba(0,0,0,0.35);
-        z-index: 9999;
-        cursor: pointer;
-        transition: all 0.4s cubic-bezier(.25,.8,.25,1);
-    }}
-    .chatbot-btn:hover {{
-        background: linear-gradient(135deg, #0B5ED7, #2C9AB7);
-        transform: scale(1.2) rotate(10deg);
-        box-shadow: 0 12px 25px rgba(0,0,0,0.45);
-    }}
-    .chatbot-btn:active {{
-        transform: scale(1) rotate(0deg);
-        box-shadow: 0 6px 15px rgba(0,0,0,0.3);
-    }}
-    </style>
-
-    <a href="{chatbot_url}" target="_blank" class="chatbot-btn">💬</a>
-    """,
-    unsafe_allow_html=True
-)
-
-# Auto-refresh every few seconds
-time.sleep(2)
-st.rerun()
+# Floating Chatbot Button (Round Style); its CSS ships with page_bg
+st.markdown(CHATBOT_BUTTON, unsafe_allow_html=True)
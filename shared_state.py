@@ -1,18 +1,53 @@
-import json
-from datetime import datetime
-import gspread
-from google.oauth2.service_account import Credentials
+import base64
+import msgpack
+import numpy as np
+from datetime import datetime, timedelta, timezone
+import logging
 import threading
 import time
+import zstandard
+
+logger = logging.getLogger(__name__)
 
 # Global variables for optimization
 _sheets_client = None
+_credentials = None
+_spreadsheet_cache = None
 _worksheet_cache = None
-_last_save_time = 0
+_sheets_ready = False  # client, spreadsheet and worksheet are all connected
+_sheets_lock = threading.Lock()
+_warm_up_thread = None  # started by warm_up(), not at import
 _pending_data = None
+_pending_dirty = False  # set by save_shared_state, cleared when the sync worker takes a snapshot
+_pending_lock = threading.RLock()  # every read and write of _pending_data goes through it
+
+# The sync worker writes the latest _pending_data on a timer until this is set;
+# it is started by the first save, so processes that only read never run it
+_stop_sync = threading.Event()
+_sync_thread = None
+
+# Stale-while-revalidate cache of the last state read from Google Sheets
+_state_cache = None
+_state_cache_time = 0
+_state_cache_updated = None  # the cached state's last_update as epoch seconds, parsed once per refresh
+_state_refreshing = False
+_state_cache_lock = threading.Lock()
+
+# Last raw Sheets row and the state parsed from it; an unchanged row is not decoded again
+_parsed_record = None
+_parsed_state = None
 
 # Configuration
 WORKSHEET_NAME = "dashboard_data"
+HEADERS = ("timestamp", "scenario", "payload", "last_update")
+HEADER_RANGE = "A1:D1"
+STATE_RANGE = "A2:D2"  # the single row holding the latest state
+_SAVE_RANGE = f"'{WORKSHEET_NAME}'!{STATE_RANGE}"  # sheet-qualified, for values_batch_update
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"  # first bytes of every zstd frame
+SYNC_INTERVAL_SECONDS = 30  # at most one Sheets write per interval
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)  # refresh the access token this long before it expires
+CACHE_FRESH_SECONDS = 10   # serve the cached state as-is
+CACHE_MAX_AGE_SECONDS = 30  # serve it while refreshing in the background; older -> blocking read
 
 def get_secrets():
     """Get secrets safely - only when streamlit is ready"""
@@ -20,221 +55,383 @@ def get_secrets():
         import streamlit as st
         return st.secrets
     except Exception as e:
-        print(f"Warning: Could not access streamlit secrets: {e}")
+        logger.warning("Could not access streamlit secrets: %s", e)
         # Fallback - return None so app can work without Google Sheets
         return None
 
-def get_sheets_client():
-    """Initialize Google Sheets client with caching"""
-    global _sheets_client
+def _init_sheets():
+    """Connect once: client, spreadsheet and worksheet from a single secrets read"""
+    global _sheets_client, _credentials, _spreadsheet_cache, _worksheet_cache, _sheets_ready
     
-    if _sheets_client is None:
+    with _sheets_lock:
+        if _sheets_ready:
+            return True
         try:
+            # gspread/google-auth/requests are imported here, on the first connection, not with the module
+            import gspread
+            from google.oauth2.service_account import Credentials
+            from urllib3.util.retry import Retry
+            from sheets_http import KeepAliveAdapter
+            
             secrets = get_secrets()
             if not secrets:
-                print("❌ No secrets available - Google Sheets disabled")
-                return None
-            
-            scope = ["https://spreadsheets.google.com/feeds", 
-                     "https://www.googleapis.com/auth/drive"]
+                logger.warning("❌ No secrets available - Google Sheets disabled")
+                return False
             
-            service_account_info = {
-                "type": secrets["SERVICE_ACCOUNT"]["type"],
-                "project_id": secrets["SERVICE_ACCOUNT"]["project_id"],
-                "private_key_id": secrets["SERVICE_ACCOUNT"]["private_key_id"],
-                "private_key": secrets["SERVICE_ACCOUNT"]["private_key"],
-                "client_email": secrets["SERVICE_ACCOUNT"]["client_email"],
-                "client_id": secrets["SERVICE_ACCOUNT"]["client_id"],
-                "auth_uri": secrets["SERVICE_ACCOUNT"]["auth_uri"],
-                "token_uri": secrets["SERVICE_ACCOUNT"]["token_uri"],
-                "auth_provider_x509_cert_url": secrets["SERVICE_ACCOUNT"]["auth_provider_x509_cert_url"],
-                "client_x509_cert_url": secrets["SERVICE_ACCOUNT"]["client_x509_cert_url"],
-                "universe_domain": secrets["SERVICE_ACCOUNT"]["universe_domain"]
-            }
+            # Parse the service-account key once; refresh_credentials renews the token on this same object
+            if _credentials is None:
+                scope = ["https://spreadsheets.google.com/feeds", 
+                         "https://www.googleapis.com/auth/drive"]
+                
+                service_account_info = {
+                    "type": secrets["SERVICE_ACCOUNT"]["type"],
+                    "project_id": secrets["SERVICE_ACCOUNT"]["project_id"],
+                    "private_key_id": secrets["SERVICE_ACCOUNT"]["private_key_id"],
+                    "private_key": secrets["SERVICE_ACCOUNT"]["private_key"],
+                    "client_email": secrets["SERVICE_ACCOUNT"]["client_email"],
+                    "client_id": secrets["SERVICE_ACCOUNT"]["client_id"],
+                    "auth_uri": secrets["SERVICE_ACCOUNT"]["auth_uri"],
+                    "token_uri": secrets["SERVICE_ACCOUNT"]["token_uri"],
+                    "auth_provider_x509_cert_url": secrets["SERVICE_ACCOUNT"]["auth_provider_x509_cert_url"],
+                    "client_x509_cert_url": secrets["SERVICE_ACCOUNT"]["client_x509_cert_url"],
+                    "universe_domain": secrets["SERVICE_ACCOUNT"]["universe_domain"]
+                }
+                
+                _credentials = Credentials.from_service_account_info(service_account_info, scopes=scope)
             
-            credentials = Credentials.from_service_account_info(service_account_info, scopes=scope)
-            _sheets_client = gspread.authorize(credentials)
-            print("✅ Google Sheets client initialized")
+            if _sheets_client is None:
+                client = gspread.authorize(_credentials)
+                # Keep pooled keep-alive connections and back off on quota (429) and server errors;
+                # urllib3 only retries idempotent methods, so the GET reads are retried, POST writes are not
+                # TCP keepalive (KeepAliveAdapter) so the pooled sockets survive the idle gaps between syncs
+                adapter = KeepAliveAdapter(pool_connections=4, pool_maxsize=8,
+                                           max_retries=Retry(total=5, backoff_factor=0.5,
+                                                             status_forcelist=[429, 500, 502, 503, 504]))
+                client.http_client.session.mount("https://", adapter)
+                _sheets_client = client
+                logger.info("✅ Google Sheets client initialized")
         except Exception as e:
-            print(f"❌ Error connecting to Google Sheets: {e}")
-            return None
-    
-    return _sheets_client
-
-def get_worksheet():
-    """Get worksheet with caching"""
-    global _worksheet_cache
-    
-    if _worksheet_cache is None:
+            logger.error("❌ Error connecting to Google Sheets: %s", e)
+            return False
+        
         try:
-            secrets = get_secrets()
-            if not secrets:
-                return None
-                
-            client = get_sheets_client()
-            if not client:
-                return None
-                
-            spreadsheet_id = secrets["GOOGLE_SHEETS_ID"]
-            spreadsheet = client.open_by_key(spreadsheet_id)
+            spreadsheet = _sheets_client.open_by_key(secrets["GOOGLE_SHEETS_ID"])
             
             try:
-                _worksheet_cache = spreadsheet.worksheet(WORKSHEET_NAME)
+                worksheet = spreadsheet.worksheet(WORKSHEET_NAME)
             except gspread.WorksheetNotFound:
-                _worksheet_cache = spreadsheet.add_worksheet(title=WORKSHEET_NAME, rows="100", cols="10")
-                # إضافة headers
-                headers = ["timestamp", "scenario", "row_indices", "prediction_data", "data_buffer", "last_update"]
-                _worksheet_cache.append_row(headers)
+                worksheet = spreadsheet.add_worksheet(title=WORKSHEET_NAME, rows=100, cols=len(HEADERS))
+                # إضافة headers وصف بيانات فاضي في request واحد: أول save بعد كده overwrite لـ A2:D2 مش إنشاء
+                worksheet.batch_update([
+                    {"range": HEADER_RANGE, "values": [list(HEADERS)]},
+                    {"range": STATE_RANGE, "values": [[""] * len(HEADERS)]},
+                ])
+            else:
+                # Sheet from the older six-column layout: drop the leftover E:F cells and rewrite the header.
+                # After the resize col_count matches HEADERS, so this runs once per sheet
+                if worksheet.col_count > len(HEADERS):
+                    worksheet.resize(cols=len(HEADERS))
+                    worksheet.update([list(HEADERS)], HEADER_RANGE)
+            _spreadsheet_cache, _worksheet_cache = spreadsheet, worksheet
+            _sheets_ready = True
                 
-            print("✅ Worksheet cached")
+            logger.info("✅ Worksheet cached")
+            return True
         except Exception as e:
-            print(f"❌ Error accessing worksheet: {e}")
-            return None
-    
+            logger.error("❌ Error accessing worksheet: %s", e)
+            return False
+
+def refresh_credentials():
+    """Refresh the access token ahead of expiry so no save stalls on a synchronous refresh"""
+    if _credentials is None:
+        return
+    # google-auth keeps expiry as naive UTC
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if _credentials.valid and _credentials.expiry and _credentials.expiry - now > TOKEN_REFRESH_MARGIN:
+        return
+    try:
+        from google.auth.transport.requests import Request
+        with _sheets_lock:
+            # The client's AuthorizedSession holds this same object, so it picks up the new token
+            _credentials.refresh(Request())
+        logger.debug("🔑 Google credentials refreshed")
+    except Exception as e:
+        logger.exception("❌ Error refreshing Google credentials: %s", e)
+
+def get_sheets_client():
+    """Google Sheets client, or None if Sheets is unavailable"""
+    if not _sheets_ready:
+        _init_sheets()
+    return _sheets_client
+
+def get_worksheet():
+    """Cached worksheet, or None if Sheets is unavailable"""
+    if not _sheets_ready and not _init_sheets():
+        return None
     return _worksheet_cache
 
+def warm_up():
+    """Start connecting to Sheets in the background, so the first save/load doesn't wait; no-op after the first call"""
+    global _warm_up_thread
+    
+    if _warm_up_thread is None and not _sheets_ready:
+        _warm_up_thread = threading.Thread(target=_init_sheets, name="sheets-connect", daemon=True)
+        _warm_up_thread.start()
+
+def _pack_default(obj):
+    """msgpack fallback for the non-native values in a payload"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def pack_payload(payload):
+    """msgpack the payload, zstd-compress it and base85-encode it so it fits in a text cell"""
+    # Sensor values and probabilities are float32 at the source, so 4-byte floats lose nothing
+    packed = msgpack.packb(payload, default=_pack_default, use_single_float=True)
+    # The one-shot functions use a fresh context per call; compressor objects aren't thread-safe
+    return base64.b85encode(zstandard.compress(packed, 1)).decode()
+
+def unpack_payload(text):
+    """Inverse of pack_payload"""
+    data = base64.b85decode(text)
+    # Payloads written before compression are bare msgpack, which never starts with the zstd magic
+    if data[:4] == ZSTD_MAGIC:
+        data = zstandard.decompress(data)
+    return msgpack.unpackb(data)
+
 def save_in_background(data_buffer, scenario, row_indices, prediction_data):
     """Save data to Google Sheets in background thread"""
     try:
         worksheet = get_worksheet()
         if not worksheet:
-            print("⚠️ No worksheet available - skipping save")
+            logger.warning("⚠️ No worksheet available - skipping save")
             return
         
-        # تحضير البيانات للحفظ
-        cleaned_buffer = []
-        for item in data_buffer[-20:]:  # قلل العدد لـ 20 بدل 50
-            if isinstance(item, dict):
-                cleaned_item = item.copy()
-                if 'timestamp' in cleaned_item:
-                    cleaned_item['timestamp'] = cleaned_item['timestamp'].isoformat()
-                cleaned_buffer.append(cleaned_item)
+        # Columns instead of records: each key name is written once, not once per point
+        points = data_buffer[-20:]  # قلل العدد لـ 20 بدل 50
+        columns = {key: [point[key] for point in points] for key in (points[0] if points else ())}
+        if 'timestamp' in columns:
+            # Integer epoch microseconds in one vectorized pass: no per-point isoformat, and exact
+            # (a float would be squeezed to 4 bytes by use_single_float)
+            columns['timestamp'] = np.array(columns['timestamp'], dtype='datetime64[us]').astype(np.int64)
         
-        # حفظ البيانات في الـ sheet
+        # حفظ البيانات في الـ sheet: الـ JSON كله في خلية واحدة (payload)
+        # وقت واحد للصف وللـ log: HH:MM:SS هي حروف 11-19 من الـ ISO string
         current_time = datetime.now().isoformat()
+        payload = {
+            'row_indices': row_indices,
+            'prediction_data': prediction_data,
+            'data_buffer': columns
+        }
         row_data = [
             current_time,
             scenario,
-            json.dumps(row_indices),
-            json.dumps(prediction_data),
-            json.dumps(cleaned_buffer),
+            pack_payload(payload),
             current_time
         ]
         
         # بدل مسح الصفوف، اكتب فوق الصف الثاني (index 2)
-        try:
-            worksheet.update(f"A2:F2", [row_data])
-            print(f"✅ Data updated in Google Sheets at {datetime.now().strftime('%H:%M:%S')}")
-        except Exception as e:
-            # لو فشل التحديث، جرب الإضافة
-            worksheet.append_row(row_data)
-            print(f"✅ Data appended to Google Sheets at {datetime.now().strftime('%H:%M:%S')}")
+        # values.batchUpdate: any extra ranges can ride along in the same request and quota unit
+        body = {
+            "valueInputOption": "RAW",
+            "data": [
+                {"range": _SAVE_RANGE, "values": [row_data]},
+            ]
+        }
+        # No append_row fallback: readers only look at row 2, so an appended row would never be seen.
+        # A failed write goes to the handler below; the next saved state is written to row 2 again
+        _spreadsheet_cache.values_batch_update(body)
+        logger.debug("✅ Data updated in Google Sheets at %s", current_time[11:19])
             
     except Exception as e:
-        print(f"❌ Background save error: {e}")
+        logger.exception("❌ Background save error: %s", e)
+
+def sync_worker():
+    """Every SYNC_INTERVAL_SECONDS, write the latest pending state to Google Sheets if it changed"""
+    # The first snapshot is written right away, later ones once per interval
+    while True:
+        refresh_credentials()
+        flush_pending()
+        if _stop_sync.wait(SYNC_INTERVAL_SECONDS):
+            break
+
+def flush_pending():
+    """Write the pending state now if it hasn't been written yet"""
+    # Deliberately not run at exit: a retrying network write could stall interpreter shutdown and
+    # race the worker's in-flight save. State saved after the last sync (under one interval) is dropped
+    global _pending_dirty
+    
+    with _pending_lock:
+        snapshot = _pending_data if _pending_dirty else None
+        _pending_dirty = False
+    if snapshot is not None:
+        save_in_background(**snapshot)
+
+def stop_sync_worker():
+    """Let the sync worker exit after its current wait"""
+    _stop_sync.set()
 
 def save_shared_state(data_buffer, scenario, row_indices, prediction_data):
     """حفظ الحالة المشتركة في Google Sheets (محسن للأداء)"""
-    global _last_save_time, _pending_data
+    global _pending_data, _pending_dirty, _sync_thread
     
-    current_time = time.time()
-    
-    # حفظ البيانات مؤقتاً
-    _pending_data = {
-        'data_buffer': data_buffer,
-        'scenario': scenario,
-        'row_indices': row_indices,
-        'prediction_data': prediction_data
-    }
-    
-    # احفظ في Google Sheets كل 15 ثانية بدل كل 10 ثوان
-    if current_time - _last_save_time >= 15:
-        _last_save_time = current_time
-        
-        # اعمل الحفظ في background thread عشان ميبطئش الواجهة
-        threading.Thread(
-            target=save_in_background,
-            args=(data_buffer, scenario, row_indices, prediction_data),
-            daemon=True
-        ).start()
-        
-        return True
+    # tuple ثابت من آخر 20 نقطة: الـ sync worker والـ readers بيرجعوه زي ما هو من غير نسخ تاني
+    buffer_tail = tuple(data_buffer[-20:])
+    with _pending_lock:
+        _pending_data = {
+            'data_buffer': buffer_tail,
+            'scenario': scenario,
+            'row_indices': row_indices,
+            'prediction_data': prediction_data
+        }
+        _pending_dirty = True
+        if _sync_thread is None:
+            _sync_thread = threading.Thread(target=sync_worker, name="sheets-save", daemon=True)
+            _sync_thread.start()
     
     return True  # ارجع True عشان الواجهة تفتكر إن الحفظ نجح
 
-def load_shared_state():
-    """قراءة الحالة المشتركة من Google Sheets (محسن)"""
-    global _pending_data
-    
-    # لو في بيانات مؤقتة، ارجعها فوراً
-    if _pending_data:
-        return {
-            'current_scenario': _pending_data['scenario'],
-            'row_indices': _pending_data['row_indices'],
-            'prediction_data': _pending_data['prediction_data'],
-            'data_buffer': _pending_data['data_buffer'][-20:],  # آخر 20 نقطة فقط
-            'last_update': datetime.now().isoformat()
-        }
+def fetch_shared_state():
+    """Read the latest shared state row straight from Google Sheets"""
+    global _parsed_record, _parsed_state
     
     try:
         worksheet = get_worksheet()
         if not worksheet:
             return None
         
-        records = worksheet.get_all_records()
-        if not records:
+        # save_in_background always writes row 2, so read just that row instead of the whole sheet
+        from gspread.utils import ValueRenderOption
+        rows = worksheet.get(STATE_RANGE, value_render_option=ValueRenderOption.unformatted)
+        if not rows or len(rows[0]) < len(HEADERS):
             return None
             
-        # اخذ آخر سجل
-        latest_record = records[-1]
+        latest_record = rows[0]
+        if latest_record == _parsed_record:
+            # Every caller and session gets the memoized state: a fresh top-level dict around the shared tuple
+            return dict(_parsed_state)
         
         # تحويل البيانات من strings إلى objects
+        _, scenario, payload, last_update = latest_record[:len(HEADERS)]
+        payload = unpack_payload(payload)
         state = {
-            'current_scenario': latest_record['scenario'],
-            'row_indices': json.loads(latest_record['row_indices']),
-            'prediction_data': json.loads(latest_record['prediction_data']),
-            'data_buffer': json.loads(latest_record['data_buffer']),
-            'last_update': latest_record['last_update']
+            'current_scenario': scenario,
+            'row_indices': payload['row_indices'],
+            'prediction_data': payload['prediction_data'],
+            'data_buffer': payload['data_buffer'],
+            'last_update': last_update
         }
         
-        # تحويل timestamps من strings إلى datetime objects
-        if 'data_buffer' in state:
-            for item in state['data_buffer']:
-                if 'timestamp' in item and isinstance(item['timestamp'], str):
-                    item['timestamp'] = datetime.fromisoformat(item['timestamp'])
+        # data_buffer is stored as columns; rebuild the point dicts the apps consume.
+        # تحويل timestamps من epoch microseconds إلى datetime objects، كلهم مرة واحدة عن طريق numpy
+        columns = state['data_buffer']
+        if 'timestamp' in columns:
+            stamps = columns['timestamp']
+            # Payloads from before the integer encoding hold ISO strings, which numpy parses directly
+            source = 'datetime64[us]' if stamps and isinstance(stamps[0], str) else np.int64
+            columns['timestamp'] = np.array(stamps, dtype=source).astype('datetime64[us]').astype(object)
+        # tuple زي pending_state: محدش يقدر يعدل الـ buffer المشترك
+        state['data_buffer'] = tuple(dict(zip(columns, values)) for values in zip(*columns.values()))
         
-        return state
+        _parsed_record, _parsed_state = latest_record, state
+        return dict(state)
         
     except Exception as e:
-        print(f"❌ Error loading from Google Sheets: {e}")
+        logger.exception("❌ Error loading from Google Sheets: %s", e)
         return None
 
+def refresh_state_cache():
+    """Fetch the state from Google Sheets into the cache"""
+    global _state_cache, _state_cache_time, _state_cache_updated
+    
+    refresh_credentials()
+    state = fetch_shared_state()
+    try:
+        updated = datetime.fromisoformat(state['last_update']).timestamp()
+    except (TypeError, KeyError, ValueError):
+        updated = None
+    with _state_cache_lock:
+        _state_cache = state
+        _state_cache_time = time.time()
+        _state_cache_updated = updated
+
+def _background_refresh():
+    """refresh_state_cache on the thread get_cached_state started; only this thread clears the flag"""
+    global _state_refreshing
+    
+    try:
+        refresh_state_cache()
+    finally:
+        with _state_cache_lock:
+            _state_refreshing = False
+
+def get_cached_state():
+    """Cached Sheets state: fresh -> as-is, stale -> as-is plus background refresh, expired -> blocking read"""
+    global _state_refreshing
+    
+    with _state_cache_lock:
+        age = time.time() - _state_cache_time
+        state = _state_cache
+        start_refresh = CACHE_FRESH_SECONDS <= age < CACHE_MAX_AGE_SECONDS and not _state_refreshing
+        if start_refresh:
+            _state_refreshing = True
+    
+    if age >= CACHE_MAX_AGE_SECONDS:
+        refresh_state_cache()
+        with _state_cache_lock:
+            return _state_cache
+    
+    if start_refresh:
+        threading.Thread(target=_background_refresh, daemon=True).start()
+    
+    return state
+
+def pending_state():
+    """State built from the in-process pending data, or None if nothing was saved here"""
+    with _pending_lock:
+        pending = _pending_data
+    if not pending:
+        return None
+    return {
+        'current_scenario': pending['scenario'],
+        'row_indices': pending['row_indices'],
+        'prediction_data': pending['prediction_data'],
+        'data_buffer': pending['data_buffer'],  # آخر 20 نقطة فقط (tuple)
+        'last_update': datetime.now().isoformat()
+    }
+
+def load_shared_state():
+    """قراءة الحالة المشتركة من Google Sheets (محسن)"""
+    # لو في بيانات مؤقتة، ارجعها فوراً
+    state = pending_state()
+    if state:
+        return state
+    
+    return get_cached_state()
+
 def is_state_fresh(max_age_seconds=30):  # زود الوقت لـ 30 ثانية
     """فحص إن الحالة المشتركة حديثة"""
-    global _pending_data
-    
     # لو في بيانات مؤقتة، ارجعها كـ fresh
-    if _pending_data:
-        return True, {
-            'current_scenario': _pending_data['scenario'],
-            'row_indices': _pending_data['row_indices'],
-            'prediction_data': _pending_data['prediction_data'],
-            'data_buffer': _pending_data['data_buffer'][-20:],
-            'last_update': datetime.now().isoformat()
-        }
+    state = pending_state()
+    if state:
+        return True, state
     
     try:
-        state = load_shared_state()
-        if state and 'last_update' in state:
-            last_update = datetime.fromisoformat(state['last_update'])
-            age = (datetime.now() - last_update).total_seconds()
+        get_cached_state()
+        # last_update was parsed when the cache was filled; only the age is computed here
+        with _state_cache_lock:
+            state, updated = _state_cache, _state_cache_updated
+        if state and updated is not None:
+            age = time.time() - updated
             is_fresh = age <= max_age_seconds
             
             return is_fresh, state
         else:
             return False, None
     except Exception as e:
-        print(f"❌ Error checking state freshness: {e}")
+        logger.exception("❌ Error checking state freshness: %s", e)
         return False, None
 
 def test_shared_state():
@@ -274,4 +471,5 @@ def test_shared_state():
         print("❌ Save test failed")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     test_shared_state()
\ No newline at end of file
@@ -0,0 +1,20 @@
+"""HTTP transport for the Google Sheets session in shared_state.
+
+Kept out of shared_state so requests/urllib3 are only imported when Sheets
+connects, as with gspread and google-auth.
+"""
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets have TCP keepalive enabled"""
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        # Set on every pool manager build, including the one after unpickling
+        pool_kwargs.setdefault("socket_options", KEEPALIVE_SOCKET_OPTIONS)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)